@@ -1,47 +1,17 @@
-import rich_click as click
-from rich import print as rprint
+import sys
 
-from package import Package
-from scratch import Project
+import ui
 
+if ui.wants_rich_help(sys.argv[1:]):
+	# rich-click takes longer to import than everything else put together,
+	# it is only worth it for rendering help
+	try:
+		from rich_click.patch import patch
+	except ImportError:
+		from rich_click.cli import patch
+	patch()
 
-@click.group()
-def main():
-	...
+from cli import main
 
-
-def get_main_sprite_name(project: Project) -> str:
-	if project.name in project.sprites and project.name != 'Stage':
-		return project.name
-	else:
-		return next(filter(lambda x: x != 'Stage', project.sprites))
-
-
-@main.command('merge')
-@click.argument('main_path')
-@click.option('--main_sprite_name', type=str, default=None)
-@click.argument('pkg_path')
-@click.option('--pkg_sprite_name', type=str, default=None)
-def merge(main_path: str, pkg_path: str, main_sprite_name: str, pkg_sprite_name: str):
-	main = Project(main_path)
-	pkg  = Project(pkg_path)
-	if main_sprite_name is None:
-		main_sprite_name = get_main_sprite_name(main)
-	if pkg_sprite_name is None:
-		pkg_sprite_name = get_main_sprite_name(pkg)
-	Package.convert_sprite(main.sprites[main_sprite_name])
-	Package.convert_sprite(pkg.sprites[pkg_sprite_name])
-	main.sprites[main_sprite_name].add(pkg.sprites[pkg_sprite_name])
-	main.export_sb3(main_path)
-
-
-def remove(main_path: str, main_sprite_name: str, pkg_name: str):
-	main = Project(main_path)
-	if main_sprite_name is None:
-		main_sprite_name = get_main_sprite_name(main)
-	Package.convert(main.sprites[main_sprite_name])
-	main.sprites[main_sprite_name].remove(pkg_name)
-	main.export_sb3(main_path)
-
-
-main()
+if __name__ == '__main__':
+	main()
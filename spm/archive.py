@@ -0,0 +1,167 @@
+import os
+import struct
+import sys
+import tempfile
+import zipfile
+
+# Copying entries without inflating them reaches into zipfile internals,
+# they are only relied on in the versions this was checked against
+RAW_COPY_VERSIONS = ((3, 8), (3, 13))
+
+
+def supports_raw_copy(zf: zipfile.ZipFile) -> bool:
+	return (
+		RAW_COPY_VERSIONS[0] <= sys.version_info[:2] <= RAW_COPY_VERSIONS[1]
+		and all(hasattr(zipfile, x) for x in ('_FH_FILENAME_LENGTH', '_FH_EXTRA_FIELD_LENGTH'))
+		and all(hasattr(zf, x) for x in ('_lock', '_didModify', 'start_dir', 'NameToInfo'))
+	)
+
+
+def read_raw(zf: zipfile.ZipFile, name: str) -> tuple[zipfile.ZipInfo, bytes]:
+	"""The entry's compressed bytes, see `supports_raw_copy`."""
+	info = zf.getinfo(name)
+	fp = zf.fp
+	fp.seek(info.header_offset)
+	header = struct.unpack(zipfile.structFileHeader, fp.read(zipfile.sizeFileHeader))
+	fp.seek(
+		header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH],
+		os.SEEK_CUR
+	)
+	return info, fp.read(info.compress_size)
+
+
+def write_raw(zf: zipfile.ZipFile, info: zipfile.ZipInfo, data: bytes):
+	"""Appends an entry whose bytes are already compressed, see
+	`supports_raw_copy`."""
+	zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+	zinfo.compress_type = info.compress_type
+	zinfo.CRC = info.CRC
+	zinfo.compress_size = info.compress_size
+	zinfo.file_size = info.file_size
+	zinfo.external_attr = info.external_attr
+	# Sizes go in the local header, so drop the data descriptor bit
+	zinfo.flag_bits = info.flag_bits & ~0x8
+	with zf._lock:
+		zinfo.header_offset = zf.fp.tell()
+		zf.fp.write(zinfo.FileHeader())
+		zf.fp.write(data)
+		zf.start_dir = zf.fp.tell()
+		zf.filelist.append(zinfo)
+		zf.NameToInfo[zinfo.filename] = zinfo
+		zf._didModify = True
+
+
+def get_mode(path: str) -> int:
+	"""Mode of the file at `path`, or the one the umask gives a new file."""
+	try:
+		return os.stat(path).st_mode & 0o777
+	except FileNotFoundError:
+		umask = os.umask(0)
+		os.umask(umask)
+		return 0o666 & ~umask
+
+
+def atomic_write(path: str, data: bytes, mode: int = None):
+	"""Writes `data` next to `path` and moves it into place, readers see
+	either the old file or the new one. The file keeps its mode, a new one
+	gets `mode` or the one the umask gives."""
+	fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+	try:
+		with os.fdopen(fd, 'wb') as fp:
+			fp.write(data)
+		os.chmod(tmp_path, get_mode(path) if mode is None else mode)
+		os.replace(tmp_path, path)
+	except BaseException:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+
+class Archive:
+	"""Read-only view of a .sb3, entries are read straight from the zip."""
+	def __init__(self, path: str):
+		self.path = path
+		self._zip = None
+	
+	@property
+	def zip(self) -> zipfile.ZipFile:
+		if self._zip is None:
+			self._zip = zipfile.ZipFile(self.path)
+		return self._zip
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+	
+	def __getstate__(self):
+		# Pickled projects reopen their archive when it's next read
+		return {'path': self.path}
+	
+	def __setstate__(self, state: dict):
+		self.path = state['path']
+		self._zip = None
+	
+	def names(self) -> list[str]:
+		return self.zip.namelist()
+	
+	def read(self, name: str) -> bytes:
+		return self.zip.read(name)
+	
+	def close(self):
+		if self._zip is not None:
+			self._zip.close()
+			self._zip = None
+
+
+class ArchiveWriter:
+	"""Writes a .sb3 next to `path` and moves it into place on close."""
+	def __init__(self, path: str):
+		self.path = path
+		fd, self.tmp_path = tempfile.mkstemp(
+			dir=os.path.dirname(os.path.abspath(path)),
+			suffix='.sb3.tmp'
+		)
+		self.zip = zipfile.ZipFile(os.fdopen(fd, 'wb'), 'w', zipfile.ZIP_DEFLATED)
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc, tb):
+		if exc_type is None:
+			self.close()
+		else:
+			self.abort()
+	
+	def write(self, name: str, data: bytes):
+		self.zip.writestr(name, data)
+		return self
+	
+	def copy(self, archive: Archive, name: str, raw: bool = True):
+		"""Copies an entry from another archive.
+		With `raw` the compressed bytes are copied as they are, so the entry
+		is neither inflated nor compressed again."""
+		if (
+			not raw or not supports_raw_copy(archive.zip) or not supports_raw_copy(self.zip)
+			# Encrypted entries can't be moved between archives as they are
+			or archive.zip.getinfo(name).flag_bits & 0x1
+		):
+			self.zip.writestr(name, archive.read(name))
+			return self
+		info, data = read_raw(archive.zip, name)
+		write_raw(self.zip, info, data)
+		return self
+	
+	def close(self):
+		fp = self.zip.fp
+		self.zip.close()
+		fp.close()
+		os.chmod(self.tmp_path, get_mode(self.path))
+		os.replace(self.tmp_path, self.path)
+	
+	def abort(self):
+		fp = self.zip.fp
+		self.zip.close()
+		fp.close()
+		os.remove(self.tmp_path)
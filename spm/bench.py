@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for SPM
+  > python spm/bench.py track [--max-blocks N]
+    Times Package.track_block_ids on synthetic sprites of doubling size, the
+    time per block should stay flat.
+  > python spm/bench.py run [--blocks N] [--save FILE] [--baseline FILE]
+    Times load, track, merge, export and remove of a synthetic package into
+    a synthetic project, each phase separately, and records their memory
+    peaks. With --baseline the run fails when a phase got slower than the
+    baseline by more than --tolerance.
+  > python spm/bench.py startup [--repeat N]
+    Times the CLI in fresh interpreters, for --help and small commands that
+    is mostly imports, and shows which commands import rich.
+"""
+
+import argparse
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import synth
+from package import Package
+from scratch import Project, Sprite
+
+PHASES = ('load', 'track', 'merge', 'export', 'remove')
+
+
+def make_sprite(name: str, blocks: dict[str, dict]) -> Sprite:
+	return Sprite({
+		'isStage': False, 'name': name,
+		'variables': {'vid': ['v', 0]}, 'lists': {}, 'broadcasts': {},
+		'blocks': blocks, 'comments': {}, 'costumes': [], 'sounds': []
+	}, None)
+
+
+def bench_track(max_count: int = 204800):
+	count = max_count
+	while count >= 12800 and count % 2 == 0:
+		count //= 2
+	print(f'{"blocks":>8} {"seconds":>9} {"us/block":>9}')
+	while count <= max_count:
+		blocks = synth.make_blocks(count)
+		best = float('inf')
+		for _ in range(3):
+			sprite = make_sprite('Bench', copy.deepcopy(blocks))
+			sprite.__class__ = Package
+			start = time.perf_counter()
+			sprite.track_block_ids()
+			best = min(best, time.perf_counter() - start)
+		print(f'{len(blocks):>8} {best:>9.4f} {best / len(blocks) * 1e6:>9.3f}')
+		count *= 2
+
+
+def run_phases(main_path: str, pkg_path: str, out_path: str, trace: bool) -> dict[str, dict]:
+	"""Runs every phase once, returns {phase: {'seconds', 'peak_bytes'}}."""
+	results = {}
+	state = {}
+	def load():
+		state['main'] = Project(main_path)
+		state['pkg'] = Project(pkg_path)
+	def track():
+		state['sprite'] = state['main'].sprites[state['main'].get_main_sprite_name()]
+		state['pkg_sprite'] = state['pkg'].sprites[state['pkg'].get_main_sprite_name()]
+		Package.convert_sprite(state['sprite'])
+		Package.convert_sprite(state['pkg_sprite'])
+	def merge():
+		state['sprite'].add(state['pkg_sprite'])
+	def export():
+		state['main'].export_sb3(out_path)
+	def remove():
+		state['sprite'].remove(state['pkg_sprite'].name)
+	for name, phase in zip(PHASES, (load, track, merge, export, remove)):
+		if trace:
+			tracemalloc.start()
+		start = time.perf_counter()
+		phase()
+		seconds = time.perf_counter() - start
+		peak = None
+		if trace:
+			peak = tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+		results[name] = {'seconds': seconds, 'peak_bytes': peak}
+	return results
+
+
+def bench_run(params: dict, repeat: int) -> dict:
+	with tempfile.TemporaryDirectory() as tmp:
+		main_path = synth.make_project(
+			f'{tmp}/BenchMain.sb3', blocks=params['blocks'] // 10,
+			variables=params['variables'], lists=params['lists'],
+			costumes=params['costumes'], costume_size=params['costume_size']
+		)
+		pkg_path = synth.make_project(
+			f'{tmp}/BenchPkg.sb3', blocks=params['blocks'],
+			variables=params['variables'], lists=params['lists'],
+			costumes=params['costumes'], costume_size=params['costume_size']
+		)
+		runs = [
+			run_phases(main_path, pkg_path, f'{tmp}/out.sb3', False)
+			for _ in range(repeat)
+		]
+		# Memory is measured on its own run, tracing slows everything down
+		peaks = run_phases(main_path, pkg_path, f'{tmp}/out.sb3', True)
+	return {
+		'params': params,
+		'phases': {
+			name: {
+				'seconds': min(run[name]['seconds'] for run in runs),
+				'peak_bytes': peaks[name]['peak_bytes']
+			}
+			for name in PHASES
+		}
+	}
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+	regressions = []
+	if result['params'] != baseline['params']:
+		print('warning: baseline was recorded with different parameters')
+	for name in PHASES:
+		now, then = result['phases'][name], baseline['phases'].get(name)
+		if then is None:
+			continue
+		for key in ('seconds', 'peak_bytes'):
+			if then[key] and now[key] > then[key] * (1 + tolerance):
+				regressions.append(
+					f'{name} {key}: {now[key]:.4g} vs {then[key]:.4g} in baseline'
+				)
+	return regressions
+
+
+def get_imports(args: list[str], env: dict) -> list[str]:
+	process = subprocess.run(
+		[sys.executable, '-X', 'importtime', *args], env=env,
+		stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True
+	)
+	# import time: self [us] | cumulative | imported package
+	return [
+		line.rsplit('|', 1)[1].strip()
+		for line in process.stderr.splitlines()
+		if line.startswith('import time:') and not line.endswith('imported package')
+	]
+
+
+def bench_startup(repeat: int = 10):
+	spm = os.path.dirname(os.path.abspath(__file__))
+	with tempfile.TemporaryDirectory() as tmp:
+		env = {**os.environ, 'XDG_CACHE_HOME': tmp}
+		main_path = synth.make_project(f'{tmp}/StartupMain.sb3', blocks=10, costumes=1)
+		pkg_path = synth.make_project(f'{tmp}/StartupPkg.sb3', blocks=10, costumes=1)
+		subprocess.run([sys.executable, spm, 'merge', main_path, pkg_path], env=env, check=True)
+		cases = {
+			'python': ['-c', 'pass'],
+			'import engine': ['-c', f'import sys; sys.path.insert(0, {spm!r}); import commands'],
+			'--help': [spm, '--help'],
+			'list': [spm, 'list', main_path],
+			'merge': [spm, 'merge', main_path, pkg_path],
+		}
+		print(f'{"command":>14} {"best ms":>8} {"median ms":>10} {"modules":>8} {"rich":>5}')
+		for name, args in cases.items():
+			times = []
+			for _ in range(repeat):
+				start = time.perf_counter()
+				subprocess.run(
+					[sys.executable, *args], env=env, check=True,
+					stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+				)
+				times.append(time.perf_counter() - start)
+			imports = get_imports(args, env)
+			rich = 'yes' if any(x.split('.')[0] in ('rich', 'rich_click') for x in imports) else 'no'
+			print(
+				f'{name:>14} {min(times) * 1e3:>8.1f} {statistics.median(times) * 1e3:>10.1f} '
+				f'{len(imports):>8} {rich:>5}'
+			)
+
+
+def main():
+	parser = argparse.ArgumentParser(description='SPM benchmarks')
+	commands = parser.add_subparsers(dest='command', required=True)
+	track = commands.add_parser('track')
+	track.add_argument('--max-blocks', type=int, default=204800)
+	run = commands.add_parser('run')
+	run.add_argument('--blocks', type=int, default=100000)
+	run.add_argument('--variables', type=int, default=50)
+	run.add_argument('--lists', type=int, default=10)
+	run.add_argument('--costumes', type=int, default=20)
+	run.add_argument('--costume-size', type=int, default=100000)
+	run.add_argument('--repeat', type=int, default=3)
+	run.add_argument('--save', type=str, default=None)
+	run.add_argument('--baseline', type=str, default=None)
+	run.add_argument('--tolerance', type=float, default=0.2)
+	startup = commands.add_parser('startup')
+	startup.add_argument('--repeat', type=int, default=10)
+	args = parser.parse_args()
+	if args.command == 'track':
+		bench_track(args.max_blocks)
+		return
+	if args.command == 'startup':
+		bench_startup(args.repeat)
+		return
+	result = bench_run({
+		'blocks': args.blocks, 'variables': args.variables, 'lists': args.lists,
+		'costumes': args.costumes, 'costume_size': args.costume_size
+	}, args.repeat)
+	print(f'{"phase":>8} {"seconds":>9} {"peak MB":>9}')
+	for name, phase in result['phases'].items():
+		print(f'{name:>8} {phase["seconds"]:>9.4f} {phase["peak_bytes"] / 1e6:>9.2f}')
+	if args.save is not None:
+		with open(args.save, 'w') as fp:
+			json.dump(result, fp, indent=2)
+	if args.baseline is not None:
+		with open(args.baseline, 'r') as fp:
+			regressions = compare(result, json.load(fp), args.tolerance)
+		for regression in regressions:
+			print(f'regression: {regression}')
+		if regressions:
+			sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
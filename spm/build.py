@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import commands
+from archive import atomic_write
+from cache import ProjectCache, hash_file
+from commands import Session
+from metrics import call_measured, metrics
+from resolver import sort_graph
+
+# Bump whenever what a target produces from the same inputs changes
+BUILD_VERSION = 1
+BUILD_FILE = 'spm.toml'
+STATE_NAME = '.spm-build.json'
+TARGET_KEYS = {
+	'main', 'output', 'sprite', 'packages', 'package_sprite', 'modules', 'tree_shake'
+}
+
+
+def read_build_file(path: str) -> dict:
+	try:
+		import tomllib
+	except ImportError:
+		# Before Python 3.11
+		import tomli as tomllib
+	with open(path, 'rb') as fp:
+		return tomllib.load(fp)
+
+
+class Target:
+	"""One [targets.<name>] table of spm.toml
+	  main = "src/game.sb3"         project the packages are added to
+	  output = "build/game.sb3"     where the result goes, main by default
+	  sprite = "Main"               sprite of main to add them to
+	  packages = ["engine", "lib/ui.sb3"]
+	  package_sprite = "Main"       sprite of each package to add
+	  modules = "spm-modules"       where dependencies are looked up, by
+	                                default spm-modules next to spm.toml
+	  tree_shake = true             see Package.tree_shake
+	A package or main can name another target to use its output, a target
+	whose main is another target needs its own output. Paths are relative
+	to spm.toml."""
+	def __init__(self, name: str, table: dict, base: str):
+		unknown = set(table) - TARGET_KEYS
+		if unknown:
+			raise ValueError(f'Target "{name}" has unknown keys {", ".join(sorted(unknown))}')
+		if 'main' not in table:
+			raise ValueError(f'Target "{name}" has no main')
+		self.name = name
+		self.table = table
+		self.base = base
+		self.main = table['main']
+		self.output = self.get_path(table.get('output', self.main))
+		self.sprite = table.get('sprite')
+		self.packages = list(table.get('packages', []))
+		self.package_sprite = table.get('package_sprite')
+		self.modules = self.get_path(table.get('modules', 'spm-modules'))
+		self.tree_shake = table.get('tree_shake', False)
+		# Target names in main and packages, filled in by Build
+		self.upstream: list[str] = []
+
+	def get_path(self, path: str) -> str:
+		return os.path.normpath(os.path.join(self.base, path))
+
+
+def build_target(target: Target, main_path: str, pkg_paths: list[str],
+                 use_cache: bool = True) -> dict:
+	"""Adds the packages to main and writes the result to the target's
+	output. Runs in a worker process, so only builds on Project and
+	Package through commands."""
+	start = time.perf_counter()
+	session = Session()
+	sprite = session.open_main(main_path, target.sprite)
+	resolver, merged = commands.add_packages(
+		session, main_path, sprite, pkg_paths, target.package_sprite,
+		use_cache=use_cache,
+		modules_dir=target.modules
+	)
+	removed = sprite.tree_shake() if target.tree_shake else {}
+	if merged or removed or target.output != main_path:
+		os.makedirs(os.path.dirname(target.output) or '.', exist_ok=True)
+		session.export(sprite, target.output)
+	return {
+		'merged': list(merged),
+		'removed': removed,
+		# Everything read, the packages found through dependencies too
+		'inputs': [main_path, *resolver.paths.values()],
+		'seconds': time.perf_counter() - start
+	}
+
+
+class Build:
+	"""Builds the targets of an spm.toml in dependency order, targets that
+	don't depend on each other run in parallel on `jobs` processes.
+
+	A target is only built again when its inputs changed. .spm-build.json
+	next to spm.toml keeps, for each target, the files it read last time,
+	a fingerprint of them and of the target's table, and the sha256 of its
+	output."""
+	def __init__(self, path: str = BUILD_FILE, jobs: int = 0, use_cache: bool = True,
+	             log=print):
+		self.path = path
+		self.base = os.path.dirname(path)
+		self.jobs = jobs or os.cpu_count() or 1
+		self.use_cache = use_cache
+		self.log = log
+		self.cache = ProjectCache() if use_cache else None
+		self.targets: dict[str, Target] = {
+			name: Target(name, table, self.base)
+			for name, table in read_build_file(path).get('targets', {}).items()
+		}
+		self.state_path = os.path.join(self.base, STATE_NAME)
+		self.state = self.load_state()
+		self.link_targets()
+
+	def load_state(self) -> dict:
+		try:
+			with open(self.state_path, 'r') as fp:
+				state = json.load(fp)
+		except (FileNotFoundError, ValueError):
+			return {}
+		return state if state.get('version') == BUILD_VERSION else {}
+
+	def save_state(self):
+		self.state['version'] = BUILD_VERSION
+		atomic_write(self.state_path, json.dumps(self.state, indent='\t').encode())
+
+	def link_targets(self):
+		"""Works out which targets each target needs built first."""
+		outputs = {}
+		for target in self.targets.values():
+			if target.main in self.targets and 'output' not in target.table:
+				# Writing over the other target's output would clash with it
+				raise ValueError(
+					f'Target "{target.name}" takes its main from target '
+					f'"{target.main}", it needs an output'
+				)
+			if target.output in outputs:
+				raise ValueError(
+					f'Targets "{outputs[target.output]}" and "{target.name}" '
+					f'both write {target.output}'
+				)
+			outputs[target.output] = target.name
+		for target in self.targets.values():
+			for ref in [target.main, *target.packages]:
+				if ref in self.targets:
+					upstream = ref
+				else:
+					upstream = outputs.get(target.get_path(ref))
+				if upstream == target.name and target.get_path(ref) == target.output:
+					# Built in place, main is its own output
+					continue
+				if upstream is not None:
+					target.upstream.append(upstream)
+		self.get_order(self.targets)
+
+	def get_order(self, names) -> list[str]:
+		"""`names` and everything they need, each after what it needs."""
+		def get_upstream(name: str) -> list[str]:
+			if name not in self.targets:
+				raise KeyError(f'No target "{name}" in {self.path}')
+			return self.targets[name].upstream
+		return sort_graph(names, get_upstream, 'Target')
+
+	def get_input_path(self, target: Target, ref: str) -> str:
+		if ref in self.targets:
+			return self.targets[ref].output
+		return target.get_path(ref)
+
+	def hash(self, path: str) -> str:
+		if not os.path.exists(path):
+			return None
+		if self.cache is not None:
+			return self.cache.fingerprint(path)
+		return hash_file(path)
+
+	def get_relpath(self, path: str) -> str:
+		return os.path.relpath(path, self.base or '.')
+
+	def get_fingerprint(self, target: Target, inputs: list[str]) -> str:
+		content = {
+			'version': BUILD_VERSION,
+			'table': target.table,
+			'inputs': {
+				self.get_relpath(path): self.hash(path)
+				for path in inputs
+				# A target built in place reads its own output
+				if os.path.normpath(path) != target.output
+			}
+		}
+		return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+	def is_up_to_date(self, target: Target) -> bool:
+		state = self.state.get('targets', {}).get(target.name)
+		if state is None:
+			return False
+		inputs = [os.path.join(self.base, x) for x in state['inputs']]
+		return (
+			state['fingerprint'] == self.get_fingerprint(target, inputs)
+			and state['output'] == self.hash(target.output)
+		)
+
+	def record(self, target: Target, result: dict):
+		self.state.setdefault('targets', {})[target.name] = {
+			'inputs': [self.get_relpath(x) for x in result['inputs']],
+			'fingerprint': self.get_fingerprint(target, result['inputs']),
+			'output': self.hash(target.output)
+		}
+
+	def submit(self, pool, target: Target):
+		main_path = self.get_input_path(target, target.main)
+		pkg_paths = [self.get_input_path(target, x) for x in target.packages]
+		if pool is None:
+			return build_target(target, main_path, pkg_paths, self.use_cache)
+		return pool.submit(
+			call_measured, metrics.get_worker_state(),
+			build_target, target, main_path, pkg_paths, self.use_cache
+		)
+
+	def run(self, names: list[str] = None) -> dict[str, str]:
+		"""Builds `names`, all targets by default, and whatever they need.
+		Returns name -> 'built', 'up to date', 'failed' or 'skipped'."""
+		order = self.get_order(names or self.targets)
+		status: dict[str, str] = {}
+		waiting = list(order)
+		running = {}
+		pool = ProcessPoolExecutor(self.jobs) if self.jobs > 1 and len(order) > 1 else None
+		try:
+			while waiting or running:
+				for name in list(waiting):
+					target = self.targets[name]
+					upstream = [status.get(x) for x in target.upstream]
+					if any(x in ('failed', 'skipped') for x in upstream):
+						status[name] = 'skipped'
+						waiting.remove(name)
+						self.log(f'{name}: skipped, a target it needs failed')
+						continue
+					if not all(x in ('built', 'up to date') for x in upstream):
+						continue
+					waiting.remove(name)
+					# Inputs are final once everything upstream is done
+					if self.is_up_to_date(target):
+						status[name] = 'up to date'
+						self.log(f'{name}: up to date')
+						continue
+					if pool is None:
+						self.finish(target, status, lambda: self.submit(None, target))
+					else:
+						running[self.submit(pool, target)] = target
+				if not running:
+					continue
+				done, _ = wait(running, return_when=FIRST_COMPLETED)
+				for future in done:
+					self.finish(
+						running.pop(future), status,
+						lambda: metrics.collect(future.result())
+					)
+		finally:
+			if pool is not None:
+				pool.shutdown(cancel_futures=True)
+			self.save_state()
+		if self.use_cache:
+			self.cache.evict()
+		return status
+
+	def finish(self, target: Target, status: dict[str, str], get_result):
+		try:
+			result = get_result()
+		except Exception as e:
+			status[target.name] = 'failed'
+			self.log(f'{target.name}: failed, {type(e).__name__}: {e}')
+			return
+		self.record(target, result)
+		status[target.name] = 'built'
+		self.log(
+			f'{target.name}: built {os.path.relpath(target.output)} in '
+			f'{result["seconds"]:.3f}s, added {", ".join(result["merged"]) or "nothing new"}'
+		)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import pickle
+
+from archive import atomic_write
+from jsonlib import paused_gc
+from metrics import metrics
+from package import Package
+from store import get_cache_dir
+
+# Bump whenever Project, Sprite or Package change shape, entries pickled by
+# another version are never loaded and are evicted first.
+CACHE_VERSION = 5
+DEFAULT_MAX_SIZE = 512 << 20
+
+
+def hash_file(path: str) -> str:
+	digest = hashlib.sha256()
+	with open(path, 'rb') as fp:
+		for chunk in iter(lambda: fp.read(1 << 20), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class ProjectCache:
+	"""Pickled packages, parsed and with their block IDs already tracked.
+	Entries are keyed by the sha256 of the .sb3, a file is only hashed again
+	when its size or mtime changed since it was last seen."""
+	def __init__(self, path: str = None, max_size: int = DEFAULT_MAX_SIZE):
+		self.path = os.path.join(get_cache_dir(), 'projects') if path is None else path
+		self.max_size = max_size
+		self.index_path = os.path.join(self.path, 'index.json')
+		self.index: dict[str, list] = None
+
+	def load_index(self) -> dict[str, list]:
+		if self.index is None:
+			try:
+				with open(self.index_path, 'r') as fp:
+					self.index = json.load(fp)
+			except (FileNotFoundError, ValueError):
+				self.index = {}
+		return self.index
+
+	def save_index(self):
+		os.makedirs(self.path, exist_ok=True)
+		atomic_write(self.index_path, json.dumps(self.index).encode())
+
+	def fingerprint(self, sb3_path: str) -> str:
+		"""sha256 of the file, reused while its size and mtime are unchanged."""
+		path = os.path.abspath(sb3_path)
+		stat = os.stat(path)
+		index = self.load_index()
+		if path in index and index[path][:2] == [stat.st_size, stat.st_mtime_ns]:
+			return index[path][2]
+		digest = hash_file(path)
+		index[path] = [stat.st_size, stat.st_mtime_ns, digest]
+		self.save_index()
+		return digest
+
+	def get_entry_path(self, digest: str, sprite_name: str) -> str:
+		key = hashlib.sha256(f'{digest}\0{sprite_name or ""}'.encode()).hexdigest()
+		return os.path.join(self.path, f'v{CACHE_VERSION}-{key}.pickle')
+
+	def load_package(self, sb3_path: str, sprite_name: str = None) -> Package:
+		entry_path = self.get_entry_path(self.fingerprint(sb3_path), sprite_name)
+		try:
+			with open(entry_path, 'rb') as fp, metrics.phase('cache'), paused_gc():
+				sprite = pickle.load(fp)
+			os.utime(entry_path)
+		except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+			sprite = Package.load(sb3_path, sprite_name)
+			sprite.get_digest()
+			os.makedirs(self.path, exist_ok=True)
+			atomic_write(entry_path, pickle.dumps(sprite, pickle.HIGHEST_PROTOCOL))
+		# The same contents may have been cached from another path
+		sprite.project.archive.path = sb3_path
+		return sprite
+
+	def evict(self) -> list[str]:
+		"""Drops entries of other cache versions, then the least recently
+		used ones until the cache fits in max_size."""
+		if not os.path.isdir(self.path):
+			return []
+		entries = [
+			(entry, entry.stat())
+			for entry in os.scandir(self.path)
+			if entry.is_file() and entry.name.endswith('.pickle')
+		]
+		entries.sort(key=lambda x: (
+			x[0].name.startswith(f'v{CACHE_VERSION}-'), x[1].st_mtime
+		))
+		total = sum(stat.st_size for _, stat in entries)
+		evicted = []
+		for entry, stat in entries:
+			if total <= self.max_size and entry.name.startswith(f'v{CACHE_VERSION}-'):
+				break
+			os.remove(entry.path)
+			total -= stat.st_size
+			evicted.append(entry.name)
+		return evicted
@@ -0,0 +1,316 @@
+import json
+import os
+import sys
+
+import click
+
+import commands
+import ui
+from commands import Session
+from metrics import metrics
+from scratch import Project
+from store import AssetStore
+from watch import Watcher
+
+
+@click.group()
+@click.option('--timings', is_flag=True, default=False,
+              help='Print wall and CPU time per phase and counts when done')
+@click.option('--trace-memory', is_flag=True, default=False,
+              help='Also record peak memory per phase with tracemalloc (slow)')
+@click.option('--metrics-json', type=str, default=None,
+              help='Write the timings and counts to this file as JSON')
+@click.option('--profile', type=str, default=None,
+              help='Write cProfile stats to this file')
+@click.option('--plain', is_flag=True, default=False, envvar='SPM_PLAIN',
+              help='Print plain text without colours, also set by SPM_PLAIN=1')
+@click.pass_context
+def main(ctx: click.Context, timings: bool, trace_memory: bool,
+         metrics_json: str, profile: str, plain: bool):
+	ui.plain = plain
+	# The daemon passes its own session in
+	if ctx.obj is None:
+		ctx.obj = Session()
+	if timings or trace_memory or metrics_json is not None:
+		metrics.enable(trace_memory)
+	if profile is not None:
+		import cProfile
+		profiler = cProfile.Profile()
+		profiler.enable()
+		metrics.profile = True
+	def report():
+		if profile is not None:
+			profiler.disable()
+			profiler.dump_stats(profile)
+			if metrics.worker_profiles:
+				import pstats
+				stats = pstats.Stats(profile)
+				for path in metrics.worker_profiles:
+					stats.add(path)
+					os.remove(path)
+				stats.dump_stats(profile)
+		if timings or trace_memory:
+			print(metrics.get_table(), file=sys.stderr)
+		if metrics_json is not None:
+			metrics.dump(metrics_json)
+	ctx.call_on_close(report)
+
+
+def get_summary(delta: dict) -> str:
+	"""'blocks +2 ~1, costumes -1' for what Package.add changed."""
+	parts = []
+	for key in ('blocks', 'variables', 'lists', 'costumes'):
+		counts = ' '.join(
+			f'{sign}{len(delta[key][kind])}'
+			for sign, kind in (('+', 'added'), ('~', 'changed'), ('-', 'removed'))
+			if delta[key][kind]
+		)
+		if counts:
+			parts.append(f'{key} {counts}')
+	return ', '.join(parts) or 'nothing changed'
+
+
+@main.command('merge')
+@click.argument('main_path')
+@click.option('--main_sprite_name', type=str, default=None)
+@click.argument('pkg_paths', nargs=-1)
+@click.option('--pkg_sprite_name', type=str, default=None)
+@click.option('--manifest', type=str, default=None,
+              help='File listing package paths, one per line')
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Parse packages again instead of using the project cache')
+@click.option('--jobs', '-j', type=int, default=1,
+              help='Load packages on this many processes, 0 for one per core')
+@click.option('--modules', 'modules_dir', type=str, default=None,
+              help='Where dependencies are looked up by name, defaults to '
+                   'spm-modules next to MAIN_PATH')
+@click.option('--frozen', is_flag=True, default=False,
+              help='Only check the lock of MAIN_PATH, fail if main is not up to date')
+@click.option('--tree-shake', is_flag=True, default=False,
+              help='Leave out package procedures nothing calls, and the '
+                   'variables, lists and costumes only they used')
+@click.option('--shake-report', type=str, default=None,
+              help='Write what --tree-shake removed to this file as JSON')
+@click.option('--diff-report', type=str, default=None,
+              help='Write the blocks, variables, lists and costumes each '
+                   'package added, changed and removed to this file as JSON')
+@click.pass_obj
+def merge(session: Session, main_path: str, pkg_paths: tuple[str],
+          main_sprite_name: str, pkg_sprite_name: str, manifest: str,
+          no_cache: bool, jobs: int, modules_dir: str, frozen: bool,
+          tree_shake: bool, shake_report: str, diff_report: str):
+	"""Adds packages and their dependencies to MAIN_PATH. Without any
+	packages, adds the dependencies of MAIN_PATH."""
+	pkg_paths = list(pkg_paths)
+	if manifest is not None:
+		pkg_paths += commands.read_manifest(manifest)
+	try:
+		merged, removed = commands.merge(
+			session, main_path, pkg_paths, main_sprite_name, pkg_sprite_name,
+			jobs, use_cache=not no_cache, modules_dir=modules_dir, frozen=frozen,
+			tree_shake=tree_shake
+		)
+	except ValueError as e:
+		# Only the lock is read when frozen, CI wants its message not a traceback
+		if not frozen:
+			raise
+		raise click.ClickException(str(e))
+	for name, delta in merged.items():
+		old, new = delta['version']
+		ui.echo(
+			f'{"Added" if old is None else "Updated"} [green]{name}[/green] '
+			f'{new if old in (None, new) else f"{old} -> {new}"}: {get_summary(delta)}'
+		)
+	for name, report in removed.items():
+		ui.echo(
+			f'Shook [green]{len(report["procedures"])}[/green] procedures '
+			f'({report["blocks"]} blocks), {len(report["variables"])} variables, '
+			f'{len(report["lists"])} lists and {len(report["costumes"])} costumes '
+			f'out of [green]{name}[/green]'
+		)
+	if shake_report is not None:
+		with open(shake_report, 'w') as fp:
+			json.dump(removed, fp, indent=2)
+	if diff_report is not None:
+		with open(diff_report, 'w') as fp:
+			json.dump(merged, fp, indent=2)
+	if not merged and not removed:
+		ui.echo(f'[green]{main_path}[/green] is up to date')
+
+
+@main.command('watch')
+@click.argument('main_path')
+@click.option('--main_sprite_name', type=str, default=None)
+@click.argument('pkg_paths', nargs=-1, required=True)
+@click.option('--pkg_sprite_name', type=str, default=None)
+@click.option('--interval', type=float, default=0.1,
+              help='Seconds between checks of the files')
+@click.option('--debounce', type=float, default=0.2,
+              help='Seconds a file must stay unchanged before merging it')
+def watch(main_path: str, pkg_paths: tuple[str], main_sprite_name: str,
+          pkg_sprite_name: str, interval: float, debounce: float):
+	watcher = Watcher(
+		main_path, pkg_paths, main_sprite_name, pkg_sprite_name,
+		interval, debounce, log=ui.echo
+	)
+	ui.echo(f'Watching [green]{len(pkg_paths)}[/green] packages, Ctrl+C to stop')
+	try:
+		watcher.run()
+	except KeyboardInterrupt:
+		pass
+
+
+@main.command('unpack')
+@click.argument('sb3_path')
+@click.argument('directory')
+@click.option('--cache-dir', type=str, default=None)
+def unpack(sb3_path: str, directory: str, cache_dir: str):
+	store = AssetStore(cache_dir)
+	Project(sb3_path).unpack(directory, store)
+	store.evict()
+
+
+@main.command('remove')
+@click.argument('main_path')
+@click.option('--main_sprite_name', type=str, default=None)
+@click.argument('pkg_name')
+@click.pass_obj
+def remove(session: Session, main_path: str, main_sprite_name: str, pkg_name: str):
+	commands.remove(session, main_path, pkg_name, main_sprite_name)
+
+
+def echo_counts(statuses: list[str]):
+	"""'2 built, 1 failed', exits with 1 if anything failed."""
+	counts = {x: statuses.count(x) for x in dict.fromkeys(statuses)}
+	ui.echo(', '.join(f'{count} {name}' for name, count in counts.items()))
+	if 'failed' in counts:
+		sys.exit(1)
+
+
+@main.command('build')
+@click.argument('targets', nargs=-1)
+@click.option('--file', 'build_path', type=str, default='spm.toml',
+              help='Build file listing the targets')
+@click.option('--jobs', '-j', type=int, default=0,
+              help='Build this many targets at once, 0 for one per core')
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Parse packages again instead of using the project cache')
+def build(targets: tuple[str], build_path: str, jobs: int, no_cache: bool):
+	"""Builds TARGETS of spm.toml, or all of them, and whatever they need.
+	Targets whose inputs did not change are skipped."""
+	from build import Build
+	try:
+		builder = Build(build_path, jobs, use_cache=not no_cache, log=ui.echo)
+	except (ValueError, KeyError) as e:
+		# Mistakes in spm.toml, not bugs
+		raise click.ClickException(e.args[0])
+	status = builder.run(targets)
+	echo_counts(list(status.values()))
+
+
+@main.command('update-all')
+@click.argument('directory')
+@click.argument('pkg_path')
+@click.option('--main_sprite_name', type=str, default=None)
+@click.option('--pkg_sprite_name', type=str, default=None)
+@click.option('--jobs', '-j', type=int, default=0,
+              help='Update this many projects at once, 0 for one per core')
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Parse packages again instead of using the project cache')
+def update_all(directory: str, pkg_path: str, main_sprite_name: str,
+               pkg_sprite_name: str, jobs: int, no_cache: bool):
+	"""Merges PKG_PATH again into every project under DIRECTORY that has it.
+	Projects which already have this version of it are skipped."""
+	from update import update_all
+	results = update_all(
+		directory, pkg_path, main_sprite_name, pkg_sprite_name, jobs,
+		use_cache=not no_cache, log=ui.echo
+	)
+	echo_counts([x['status'] for x in results.values()])
+
+
+@main.command('version')
+@click.argument('sb3_path')
+@click.argument('version', required=False)
+@click.option('--sprite_name', type=str, default=None)
+@click.pass_obj
+def version(session: Session, sb3_path: str, version: str, sprite_name: str):
+	"""Shows or sets the version of the package in SB3_PATH."""
+	if version is not None:
+		commands.set_version(session, sb3_path, version, sprite_name)
+		return
+	sprite = session.open_main(sb3_path, sprite_name)
+	ui.echo(f'[green]{sprite.name}[/green] {sprite.package_json["version"]}')
+	for name, spec in sprite.package_json['dependencies'].items():
+		ui.echo(f'  needs [green]{name}[/green] {spec}')
+
+
+@main.command('depend')
+@click.argument('sb3_path')
+@click.argument('name')
+@click.argument('spec', default='*')
+@click.option('--sprite_name', type=str, default=None)
+@click.option('--remove', is_flag=True, default=False,
+              help='Drop the dependency instead')
+@click.pass_obj
+def depend(session: Session, sb3_path: str, name: str, spec: str,
+           sprite_name: str, remove: bool):
+	"""Declares that the package in SB3_PATH needs package NAME, at a
+	version matching SPEC such as '>=1.2, <2'."""
+	commands.set_dependency(
+		session, sb3_path, name, None if remove else spec, sprite_name
+	)
+
+
+@main.command('list')
+@click.argument('main_path', required=False)
+@click.option('--main_sprite_name', type=str, default=None)
+@click.option('--modules', 'modules_dir', type=str, default='spm-modules',
+              help='Registry listed without MAIN_PATH')
+@click.pass_obj
+def list_packages(session: Session, main_path: str, main_sprite_name: str,
+                  modules_dir: str):
+	"""Lists the packages added to MAIN_PATH, or without it the packages in
+	the registry."""
+	if main_path is None:
+		for name, info in commands.list_registry(session, modules_dir).items():
+			ui.echo(
+				f'[green]{name}[/green] {info["version"]} '
+				f'({info["blocks"]} blocks, {len(info["costumes"])} costumes)'
+			)
+		return
+	packages = commands.list_packages(session, main_path, main_sprite_name)
+	for name, info in packages.items():
+		ui.echo(
+			f'[green]{name}[/green] {info["version"]} '
+			f'({info["blocks"]} blocks, {info["costumes"]} costumes)'
+		)
+
+
+@main.command('info')
+@click.argument('name')
+@click.option('--modules', 'modules_dir', type=str, default='spm-modules',
+              help='Registry the package is looked up in')
+@click.pass_obj
+def info(session: Session, name: str, modules_dir: str):
+	"""Shows package NAME of the registry."""
+	entry = commands.get_info(session, name, modules_dir)
+	ui.echo(f'[green]{entry["name"]}[/green] {entry["version"]}')
+	ui.echo(f'  path      {entry["path"]}')
+	ui.echo(f'  sha256    {entry["hash"]}')
+	ui.echo(f'  digest    {entry["digest"]}')
+	ui.echo(f'  blocks    {entry["blocks"]}')
+	ui.echo(f'  costumes  {", ".join(entry["costumes"]) or "none"}')
+	ui.echo(f'  assets    {", ".join(entry["assets"]) or "none"}')
+	for dependency, spec in entry['dependencies'].items():
+		ui.echo(f'  needs [green]{dependency}[/green] {spec}')
+
+
+@main.command('daemon')
+@click.option('--socket', 'socket_path', type=str, default=None,
+              help='Unix socket to listen on')
+@click.option('--max-projects', type=int, default=32,
+              help='Parsed projects and packages kept in memory')
+def daemon(socket_path: str, max_projects: int):
+	from daemon import serve
+	serve(socket_path, max_projects)
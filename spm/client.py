@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Thin client for the SPM daemon, runs a CLI command on it
+  > python spm daemon &
+  > python spm/client.py merge main.sb3 pkg.sb3
+Runs the command itself when no daemon is listening. SPM_SOCKET overrides
+the socket path for both.
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+def get_socket_path() -> str:
+	if 'SPM_SOCKET' in os.environ:
+		return os.environ['SPM_SOCKET']
+	runtime_dir = os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir())
+	return os.path.join(runtime_dir, f'spm-{os.getuid()}.sock')
+
+
+def call(method: str, params: dict, socket_path: str = None):
+	"""Sends one JSON-RPC request and returns its result."""
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.connect(socket_path or get_socket_path())
+		request = {'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params}
+		sock.sendall(json.dumps(request).encode() + b'\n')
+		with sock.makefile('rb') as fp:
+			response = json.loads(fp.readline())
+	if 'error' in response:
+		raise RuntimeError(response['error']['message'])
+	return response['result']
+
+
+def main():
+	argv = sys.argv[1:]
+	try:
+		result = call('cli', {'argv': argv, 'cwd': os.getcwd()})
+	except (FileNotFoundError, ConnectionRefusedError):
+		spm = os.path.dirname(os.path.abspath(__file__))
+		os.execv(sys.executable, [sys.executable, spm, *argv])
+	sys.stdout.write(result['stdout'])
+	sys.stderr.write(result['stderr'])
+	sys.exit(result['exit_code'])
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,216 @@
+import os
+
+from cache import ProjectCache
+from loader import load_packages
+from lock import Lock, get_lock_path
+from metrics import metrics
+from package import Package
+from registry import Registry
+from resolver import Resolver, parse_spec, parse_version
+from scratch import Project
+
+
+class Session:
+	"""Where commands get their projects from. This one parses everything
+	from disk each time, the daemon's keeps them in memory between calls."""
+	def open_main(self, main_path: str, main_sprite_name: str = None) -> Package:
+		main = Project(main_path)
+		if main_sprite_name is None:
+			main_sprite_name = main.get_main_sprite_name()
+		sprite = main.sprites[main_sprite_name]
+		Package.convert_sprite(sprite)
+		return sprite
+
+	def load_packages(self, pkg_paths: list[str], pkg_sprite_name: str = None,
+	                  jobs: int = 1, use_cache: bool = True) -> list[Package]:
+		return load_packages(pkg_paths, pkg_sprite_name, jobs, use_cache=use_cache)
+
+	def export(self, sprite: Package, sb3_path: str):
+		sprite.project.export_sb3(sb3_path)
+		# Nothing more is read once it's written, long running processes
+		# would keep every file open otherwise
+		sprite.project.close()
+
+	def discard(self, main_path: str):
+		"""Forgets an in-memory main project, e.g. after a failed command."""
+
+
+def read_manifest(manifest_path: str) -> list[str]:
+	"""One package path per line, relative to the manifest. Blank lines and
+	lines starting with '#' are ignored."""
+	base = os.path.dirname(manifest_path)
+	with open(manifest_path, 'r') as fp:
+		return [
+			os.path.join(base, line.strip())
+			for line in fp
+			if line.strip() and not line.strip().startswith('#')
+		]
+
+
+def get_modules_dir(main_path: str) -> str:
+	return os.path.join(os.path.dirname(main_path), 'spm-modules')
+
+
+def get_registry(session: Session, modules_dir: str, jobs: int = 1,
+                 use_cache: bool = True) -> Registry:
+	return Registry(
+		modules_dir,
+		lambda paths: session.load_packages(paths, None, jobs, use_cache)
+	)
+
+
+def add_packages(session: Session, main_path: str, sprite: Package,
+                 pkg_paths: list[str], pkg_sprite_name: str = None, jobs: int = 1,
+                 use_cache: bool = True, modules_dir: str = None) -> tuple[Resolver, dict[str, dict]]:
+	"""Resolves and adds the packages to `sprite` without writing it.
+	Returns the resolver, which has every package it found, and for the
+	packages that were actually added what Package.add changed."""
+	modules_dir = modules_dir or get_modules_dir(main_path)
+	resolver = Resolver(
+		lambda paths, sprite_name: session.load_packages(paths, sprite_name, jobs, use_cache),
+		modules_dir, pkg_sprite_name,
+		get_registry(session, modules_dir, jobs, use_cache)
+	)
+	merged = {}
+	try:
+		pkg_sprites = resolver.resolve(
+			pkg_paths, sprite.package_json['dependencies'], sprite.name
+		)
+		for pkg_sprite in pkg_sprites:
+			with metrics.phase('merge'):
+				if sprite.is_up_to_date(pkg_sprite):
+					continue
+				merged[pkg_sprite.name] = sprite.add(pkg_sprite)
+	except BaseException:
+		session.discard(main_path)
+		raise
+	return resolver, merged
+
+
+def merge(session: Session, main_path: str, pkg_paths: list[str],
+          main_sprite_name: str = None, pkg_sprite_name: str = None,
+          jobs: int = 1, use_cache: bool = True, modules_dir: str = None,
+          frozen: bool = False, tree_shake: bool = False) -> tuple[dict, dict]:
+	"""Adds every package, the dependencies of main and of the packages to
+	main, each after those it depends on, and writes it once. Returns what
+	changed in each package that was actually added, see Package.add, and
+	with `tree_shake` what Package.tree_shake removed.
+
+	Main's lock is updated to match. With `frozen` nothing is loaded or
+	written, it fails unless the lock says main is already up to date."""
+	lock = Lock(get_lock_path(main_path), use_cache)
+	if frozen:
+		problems = lock.verify(main_path, pkg_paths, main_sprite_name)
+		if problems:
+			raise ValueError(f'{lock.path} is out of date:\n  ' + '\n  '.join(problems))
+		return {}, {}
+	sprite = session.open_main(main_path, main_sprite_name)
+	resolver, merged = add_packages(
+		session, main_path, sprite, pkg_paths, pkg_sprite_name, jobs,
+		use_cache, modules_dir
+	)
+	try:
+		removed = {}
+		if tree_shake:
+			with metrics.phase('merge'):
+				removed = sprite.tree_shake()
+		if merged or removed:
+			session.export(sprite, main_path)
+	except BaseException:
+		session.discard(main_path)
+		raise
+	lock.set_packages(
+		{x.name: (resolver.paths[x.name], x) for x in resolver.order},
+		set(sprite.package_json['packages'])
+	)
+	lock.set_main(main_path, sprite.name)
+	lock.save()
+	if use_cache:
+		ProjectCache().evict()
+	return merged, removed
+
+
+def remove(session: Session, main_path: str, pkg_name: str,
+           main_sprite_name: str = None):
+	sprite = session.open_main(main_path, main_sprite_name)
+	try:
+		with metrics.phase('merge'):
+			sprite.remove(pkg_name)
+		session.export(sprite, main_path)
+	except BaseException:
+		session.discard(main_path)
+		raise
+	lock = Lock(get_lock_path(main_path))
+	if os.path.exists(lock.path):
+		lock.set_packages({}, set(sprite.package_json['packages']))
+		lock.set_main(main_path, sprite.name)
+		lock.save()
+
+
+def set_version(session: Session, sb3_path: str, version: str,
+                sprite_name: str = None):
+	parse_version(version)
+	sprite = session.open_main(sb3_path, sprite_name)
+	try:
+		sprite.package_json['version'] = version
+		session.export(sprite, sb3_path)
+	except BaseException:
+		session.discard(sb3_path)
+		raise
+
+
+def set_dependency(session: Session, sb3_path: str, name: str, spec: str = '*',
+                   sprite_name: str = None):
+	"""Declares that the package in `sb3_path` needs package `name` at a
+	version matching `spec`, None removes the dependency."""
+	if spec is not None:
+		parse_spec(spec)
+	sprite = session.open_main(sb3_path, sprite_name)
+	try:
+		dependencies = sprite.package_json['dependencies']
+		if spec is None:
+			if name not in dependencies:
+				raise KeyError(f'{sprite.name} does not depend on "{name}"')
+			dependencies.pop(name)
+		else:
+			dependencies[name] = spec
+		session.export(sprite, sb3_path)
+	except BaseException:
+		session.discard(sb3_path)
+		raise
+
+
+def list_packages(session: Session, main_path: str,
+                  main_sprite_name: str = None) -> dict[str, dict]:
+	"""name -> version, digest and how much each package owns."""
+	sprite = session.open_main(main_path, main_sprite_name)
+	return {
+		name: {
+			'version': owned['version'],
+			'digest': owned['digest'],
+			**{
+				key: len(owned[key])
+				for key in ('blocks', 'variables', 'lists', 'costumes')
+			}
+		}
+		for name, owned in sprite.package_json['packages'].items()
+	}
+
+
+def list_registry(session: Session, modules_dir: str = 'spm-modules',
+                  jobs: int = 1, use_cache: bool = True) -> dict[str, dict]:
+	"""name -> index entry of every package in `modules_dir`."""
+	return get_registry(session, modules_dir, jobs, use_cache).get_packages()
+
+
+def get_info(session: Session, name: str, modules_dir: str = 'spm-modules',
+             use_cache: bool = True) -> dict:
+	entry = get_registry(session, modules_dir, use_cache=use_cache).get(name)
+	if entry is None:
+		raise KeyError(f'No package "{name}" in {modules_dir}')
+	return entry
+
+
+def export(session: Session, main_path: str, out_path: str,
+           main_sprite_name: str = None):
+	session.export(session.open_main(main_path, main_sprite_name), out_path)
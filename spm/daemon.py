@@ -0,0 +1,198 @@
+import io
+import json
+import os
+import socketserver
+import threading
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+
+import commands
+from client import get_socket_path
+from commands import Session
+from metrics import metrics
+from package import Package
+from watch import get_stat
+
+
+class DaemonSession(Session):
+	"""Keeps the last `max_projects` main projects and packages parsed in
+	memory. An entry is used for as long as its file's mtime and size match
+	those it was loaded with."""
+	def __init__(self, max_projects: int = 32):
+		self.max_projects = max_projects
+		# key -> (stat, sprite), least recently used first
+		self.projects: OrderedDict[tuple, tuple] = OrderedDict()
+
+	def get(self, key: tuple, path: str) -> Package:
+		entry = self.projects.get(key)
+		if entry is None or entry[0] != get_stat(path):
+			return None
+		self.projects.move_to_end(key)
+		return entry[1]
+
+	def put(self, key: tuple, stat: tuple, sprite: Package):
+		self.projects[key] = (stat, sprite)
+		self.projects.move_to_end(key)
+		while len(self.projects) > self.max_projects:
+			_, (_, evicted) = self.projects.popitem(last=False)
+			evicted.project.close()
+
+	def open_main(self, main_path: str, main_sprite_name: str = None) -> Package:
+		key = ('main', os.path.abspath(main_path), main_sprite_name)
+		sprite = self.get(key, main_path)
+		if sprite is None:
+			stat = get_stat(main_path)
+			sprite = super().open_main(main_path, main_sprite_name)
+			self.put(key, stat, sprite)
+		return sprite
+
+	def load_packages(self, pkg_paths: list[str], pkg_sprite_name: str = None,
+	                  jobs: int = 1, use_cache: bool = True) -> list[Package]:
+		keys = [
+			('package', os.path.abspath(path), pkg_sprite_name)
+			for path in pkg_paths
+		]
+		sprites = [self.get(key, path) for key, path in zip(keys, pkg_paths)]
+		missing = [i for i, sprite in enumerate(sprites) if sprite is None]
+		stats = [get_stat(pkg_paths[i]) for i in missing]
+		loaded = super().load_packages(
+			[pkg_paths[i] for i in missing], pkg_sprite_name, jobs, use_cache
+		)
+		for i, stat, sprite in zip(missing, stats, loaded):
+			sprites[i] = sprite
+			self.put(keys[i], stat, sprite)
+		return sprites
+
+	def export(self, sprite: Package, sb3_path: str):
+		super().export(sprite, sb3_path)
+		# Keep the entry for the file we just wrote. One exported elsewhere
+		# now reads its assets from there, it is parsed again next time.
+		key = ('main', os.path.abspath(sb3_path))
+		for entry_key, (_, entry_sprite) in list(self.projects.items()):
+			if entry_sprite is not sprite:
+				continue
+			if entry_key[:2] == key:
+				self.projects[entry_key] = (get_stat(sb3_path), sprite)
+			else:
+				self.projects.pop(entry_key)
+
+	def discard(self, main_path: str):
+		key = ('main', os.path.abspath(main_path))
+		for entry_key in [x for x in self.projects if x[:2] == key]:
+			self.projects.pop(entry_key)
+
+
+class Server(socketserver.UnixStreamServer):
+	"""JSON-RPC 2.0 over a unix socket, one request per line. Requests are
+	handled one at a time, paths should be absolute except for `cli`."""
+	def __init__(self, socket_path: str, session: DaemonSession):
+		self.session = session
+		self.methods = {
+			'merge': self.merge,
+			'remove': self.remove,
+			'list': self.list_packages,
+			'export': self.export,
+			'cli': self.cli,
+			'shutdown': self.stop,
+		}
+		super().__init__(socket_path, Handler)
+
+	def merge(self, main_path: str, pkg_paths: list[str], main_sprite_name: str = None,
+	          pkg_sprite_name: str = None, jobs: int = 1, use_cache: bool = True,
+	          tree_shake: bool = False):
+		merged, removed = commands.merge(
+			self.session, main_path, pkg_paths, main_sprite_name,
+			pkg_sprite_name, jobs, use_cache, tree_shake=tree_shake
+		)
+		return {'merged': list(merged), 'changes': merged, 'removed': removed}
+
+	def remove(self, main_path: str, pkg_name: str, main_sprite_name: str = None):
+		commands.remove(self.session, main_path, pkg_name, main_sprite_name)
+
+	def list_packages(self, main_path: str, main_sprite_name: str = None):
+		return commands.list_packages(self.session, main_path, main_sprite_name)
+
+	def export(self, main_path: str, out_path: str, main_sprite_name: str = None):
+		commands.export(self.session, main_path, out_path, main_sprite_name)
+
+	def cli(self, argv: list[str], cwd: str = None):
+		"""Runs a CLI command as if `spm <argv>` was run in `cwd`."""
+		import click
+		from cli import main
+		stdout, stderr = io.StringIO(), io.StringIO()
+		old_cwd = os.getcwd()
+		exit_code = 0
+		try:
+			if cwd is not None:
+				os.chdir(cwd)
+			with redirect_stdout(stdout), redirect_stderr(stderr):
+				try:
+					main.main(
+						args=argv, prog_name='spm', obj=self.session,
+						standalone_mode=False
+					)
+				except click.exceptions.Exit as e:
+					exit_code = e.exit_code
+				except click.ClickException as e:
+					e.show()
+					exit_code = e.exit_code
+				except click.Abort:
+					exit_code = 1
+				except Exception as e:
+					print(f'{type(e).__name__}: {e}', file=stderr)
+					exit_code = 1
+		finally:
+			os.chdir(old_cwd)
+			metrics.reset()
+		return {
+			'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+			'exit_code': exit_code
+		}
+
+	def stop(self):
+		# shutdown() waits for serve_forever, which is busy running us
+		threading.Thread(target=self.shutdown).start()
+
+	def dispatch(self, request: dict) -> dict:
+		response = {'jsonrpc': '2.0', 'id': request.get('id')}
+		method = self.methods.get(request.get('method'))
+		if method is None:
+			response['error'] = {'code': -32601, 'message': 'Method not found'}
+			return response
+		params = request.get('params', {})
+		try:
+			if isinstance(params, list):
+				response['result'] = method(*params)
+			else:
+				response['result'] = method(**params)
+		except Exception as e:
+			response['error'] = {'code': -32000, 'message': f'{type(e).__name__}: {e}'}
+		return response
+
+
+class Handler(socketserver.StreamRequestHandler):
+	def handle(self):
+		for line in self.rfile:
+			try:
+				request = json.loads(line)
+			except ValueError:
+				response = {
+					'jsonrpc': '2.0', 'id': None,
+					'error': {'code': -32700, 'message': 'Parse error'}
+				}
+			else:
+				response = self.server.dispatch(request)
+			self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b'\n')
+
+
+def serve(socket_path: str = None, max_projects: int = 32):
+	socket_path = socket_path or get_socket_path()
+	if os.path.exists(socket_path):
+		os.remove(socket_path)
+	with Server(socket_path, DaemonSession(max_projects)) as server:
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			os.remove(socket_path)
@@ -0,0 +1,169 @@
+from jsonlib import paused_gc
+
+
+class BlockGraph:
+	"""Index over a sprite's blocks dict, built in one pass and kept up to
+	date by `add` and `remove`. Queries follow the index instead of
+	scanning every block, so they cost the size of the scripts they look
+	at, not of the sprite.
+
+	A block's children are its next block and the blocks in its inputs,
+	the subtree of a top level block is its whole script. Variable and list
+	reporters dropped on their own are lists instead of dicts, they are top
+	level and have no children."""
+	def __init__(self, blocks: dict[str, dict]):
+		self.blocks = blocks
+		self.parents: dict[str, str] = {}
+		self.children: dict[str, list[str]] = {}
+		self.tops: set[str] = set()
+		# proccode -> procedures_definition IDs
+		self.definitions: dict[str, set[str]] = {}
+		# proccode -> procedures_call IDs
+		self.callers: dict[str, set[str]] = {}
+		# definition or call ID -> its proccode
+		self.proccodes: dict[str, str] = {}
+		# Tens of thousands of small lists, each would count towards a
+		# collection of everything loaded so far
+		with paused_gc():
+			self.index_all()
+
+	def get_proccode(self, id: str) -> str:
+		"""proccode of a procedures_definition or procedures_call."""
+		block = self.blocks[id]
+		if block['opcode'] == 'procedures_call':
+			return block['mutation']['proccode']
+		prototype = self.blocks.get(block['inputs'].get('custom_block', [1, None])[1])
+		return None if prototype is None else prototype['mutation']['proccode']
+
+	def index_all(self):
+		"""`index` for every block, inlined since it runs over whole sprites."""
+		parents, children, tops = self.parents, self.children, self.tops
+		procedures = []
+		for id, block in self.blocks.items():
+			if type(block) is not dict:
+				tops.add(id)
+				children[id] = []
+				continue
+			parent = parents[id] = block['parent']
+			if parent is None:
+				tops.add(id)
+			next = block['next']
+			ids = [] if next is None else [next]
+			for input in block['inputs'].values():
+				if type(input[1]) is str:
+					ids.append(input[1])
+				if len(input) > 2 and type(input[2]) is str:
+					ids.append(input[2])
+			children[id] = ids
+			if block['opcode'] in ('procedures_definition', 'procedures_call'):
+				procedures.append(id)
+		for id in procedures:
+			self.index_procedure(id, self.blocks[id])
+
+	def index_procedure(self, id: str, block: dict):
+		opcode = block['opcode']
+		if opcode == 'procedures_definition':
+			index = self.definitions
+		elif opcode == 'procedures_call':
+			index = self.callers
+		else:
+			return
+		proccode = self.get_proccode(id)
+		if proccode is not None:
+			index.setdefault(proccode, set()).add(id)
+			self.proccodes[id] = proccode
+
+	def index(self, id: str, block: dict):
+		if type(block) is not dict:
+			self.tops.add(id)
+			self.children[id] = []
+			return
+		parent = block['parent']
+		self.parents[id] = parent
+		if parent is None:
+			self.tops.add(id)
+		children = [] if block['next'] is None else [block['next']]
+		for input in block['inputs'].values():
+			for value in input[1:]:
+				if type(value) is str:
+					children.append(value)
+		self.children[id] = children
+		self.index_procedure(id, block)
+
+	def unindex(self, id: str):
+		self.parents.pop(id, None)
+		self.children.pop(id, None)
+		self.tops.discard(id)
+		proccode = self.proccodes.pop(id, None)
+		if proccode is not None:
+			for index in (self.definitions, self.callers):
+				if id in index.get(proccode, ()):
+					index[proccode].discard(id)
+					if not index[proccode]:
+						index.pop(proccode)
+
+	def add(self, blocks: dict[str, dict]):
+		"""Adds or replaces blocks."""
+		for id in blocks:
+			if id in self.blocks:
+				self.unindex(id)
+		self.blocks.update(blocks)
+		with paused_gc():
+			for id, block in blocks.items():
+				self.index(id, block)
+
+	def remove(self, ids):
+		for id in ids:
+			if self.blocks.pop(id, None) is not None:
+				self.unindex(id)
+
+	def get_subtree(self, id: str) -> list[str]:
+		"""`id` and every block below it, for a top level block its script."""
+		subtree = []
+		pending = [id]
+		while pending:
+			id = pending.pop()
+			if id in self.blocks:
+				subtree.append(id)
+				pending.extend(self.children[id])
+		return subtree
+
+	def get_calls(self, top: str) -> set[str]:
+		"""proccodes called from the script of `top`."""
+		return {
+			self.proccodes[id] for id in self.get_subtree(top)
+			if id in self.proccodes and self.blocks[id]['opcode'] == 'procedures_call'
+		}
+
+	def get_reachable(self, roots) -> set[str]:
+		"""Top level IDs of `roots` and of every procedure definition they
+		call, directly or through other procedures."""
+		reached = set(roots)
+		pending = list(reached)
+		while pending:
+			for proccode in self.get_calls(pending.pop()):
+				for top in self.definitions.get(proccode, ()):
+					if top not in reached:
+						reached.add(top)
+						pending.append(top)
+		return reached
+
+	def get_references(self, ids=None) -> tuple[set[str], set[str]]:
+		"""Names of the variables and lists used by `ids`, all blocks by
+		default."""
+		variables, lists = set(), set()
+		for id in self.blocks if ids is None else ids:
+			block = self.blocks[id]
+			if type(block) is list:
+				(variables if block[0] == 12 else lists).add(block[1])
+				continue
+			fields = block['fields']
+			if 'VARIABLE' in fields:
+				variables.add(fields['VARIABLE'][0])
+			if 'LIST' in fields:
+				lists.add(fields['LIST'][0])
+			for input in block['inputs'].values():
+				for value in input[1:]:
+					if type(value) is list and value[0] in (12, 13):
+						(variables if value[0] == 12 else lists).add(value[1])
+		return variables, lists
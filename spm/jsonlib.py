@@ -0,0 +1,80 @@
+"""
+project.json (de)serialisation. orjson is used when it is installed, unless
+SPM_JSON=stdlib is set, and the json module otherwise. Both write compact
+UTF-8 and parse each other's output to the same values, only float
+exponents are spelled differently (1e-07 vs 1e-7).
+
+NaN and Infinity are the exception: only the json module reads them, and
+orjson would write them as null. Data that may hold them is written with
+the json module, see `parse` and the `nonfinite` argument of `dumps`.
+"""
+
+import gc
+import json
+import os
+from contextlib import contextmanager
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+if os.environ.get('SPM_JSON') == 'stdlib':
+	orjson = None
+
+
+@contextmanager
+def paused_gc():
+	"""Parsing or unpickling a project allocates millions of containers
+	without any cycles, pausing the garbage collector meanwhile saves it
+	scanning them over and over."""
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		if enabled:
+			gc.enable()
+
+
+def parse(data: bytes) -> tuple[object, bool]:
+	"""The parsed data, and whether it may hold NaN or Infinity."""
+	with paused_gc():
+		if orjson is not None:
+			try:
+				return orjson.loads(data), False
+			except orjson.JSONDecodeError:
+				# NaN, Infinity and the like, which only the json module reads
+				pass
+		obj = json.loads(data)
+	# Only matters when orjson would be the one writing it
+	return obj, orjson is not None and has_nonfinite(obj)
+
+
+def has_nonfinite(obj) -> bool:
+	stack = [obj]
+	while stack:
+		value = stack.pop()
+		if type(value) is dict:
+			stack.extend(value.values())
+		elif type(value) is list:
+			stack.extend(value)
+		elif type(value) is float and value - value != 0:
+			return True
+	return False
+
+
+def dumps(obj, nonfinite: bool = None) -> bytes:
+	"""`nonfinite` says whether `obj` may hold NaN or Infinity, it is looked
+	for when not given."""
+	if nonfinite is None:
+		nonfinite = orjson is not None and has_nonfinite(obj)
+	if orjson is not None and not nonfinite:
+		try:
+			return orjson.dumps(obj)
+		except TypeError:
+			# Integers past 64 bits and strings with lone surrogates
+			pass
+	try:
+		return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+	except UnicodeEncodeError:
+		return json.dumps(obj, separators=(',', ':')).encode()
@@ -0,0 +1,42 @@
+import os
+
+from cache import ProjectCache
+from jsonlib import paused_gc
+from metrics import call_measured, metrics
+from package import Package
+
+
+def load_package(sb3_path: str, sprite_name: str = None, cache_dir: str = None,
+                 use_cache: bool = True) -> Package:
+	if not use_cache:
+		return Package.load(sb3_path, sprite_name)
+	return ProjectCache(cache_dir).load_package(sb3_path, sprite_name)
+
+
+def load_packages(sb3_paths: list[str], sprite_name: str = None, jobs: int = 1,
+                  cache_dir: str = None, use_cache: bool = True) -> list[Package]:
+	"""Loads and tracks packages on `jobs` worker processes, 0 uses every
+	core. The packages come back in the order of `sb3_paths` whatever order
+	they finish in, so merging them stays deterministic."""
+	if jobs == 0:
+		jobs = os.cpu_count() or 1
+	jobs = min(jobs, len(sb3_paths))
+	if jobs <= 1:
+		return [
+			load_package(path, sprite_name, cache_dir, use_cache)
+			for path in sb3_paths
+		]
+	# Only imported here, it adds to the startup of every command otherwise
+	from concurrent.futures import ProcessPoolExecutor
+	n = len(sb3_paths)
+	state = metrics.get_worker_state()
+	with ProcessPoolExecutor(max_workers=jobs) as pool:
+		# Results are unpickled as they are collected
+		with paused_gc():
+			return [
+				metrics.collect(outcome)
+				for outcome in pool.map(
+					call_measured, [state] * n, [load_package] * n,
+					sb3_paths, [sprite_name] * n, [cache_dir] * n, [use_cache] * n
+				)
+			]
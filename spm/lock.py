@@ -0,0 +1,112 @@
+import json
+import os
+
+from archive import atomic_write
+from cache import ProjectCache, hash_file
+
+LOCK_VERSION = 1
+LOCK_SUFFIX = '.lock'
+
+
+def get_lock_path(main_path: str) -> str:
+	"""<main>.sb3.lock, each project in a directory has its own."""
+	return main_path + LOCK_SUFFIX
+
+
+class Lock:
+	"""<main>.sb3.lock, written next to the main project by every merge.
+	Lists the packages merged in the order they were merged with their
+	path, version, sha256 and digest, and the sha256 of the main project
+	that came out.
+
+	Paths are relative to the lock. The lock only changes when the result
+	does, so build caches can key on it."""
+	def __init__(self, path: str, use_cache: bool = True):
+		self.path = path
+		self.base = os.path.dirname(path)
+		self.cache = ProjectCache() if use_cache else None
+		self.json: dict = None
+
+	def load(self) -> dict:
+		if self.json is None:
+			try:
+				with open(self.path, 'r') as fp:
+					self.json = json.load(fp)
+			except FileNotFoundError:
+				self.json = {'lockVersion': LOCK_VERSION, 'main': None, 'packages': {}}
+		if self.json.get('lockVersion') != LOCK_VERSION:
+			raise ValueError(f'{self.path} was written by another version of SPM')
+		return self.json
+
+	def save(self):
+		data = json.dumps(self.json, indent='\t') + '\n'
+		try:
+			with open(self.path, 'r') as fp:
+				if fp.read() == data:
+					return
+		except FileNotFoundError:
+			pass
+		atomic_write(self.path, data.encode())
+
+	def get_relpath(self, path: str) -> str:
+		return os.path.relpath(path, self.base or '.').replace(os.sep, '/')
+
+	def get_path(self, relpath: str) -> str:
+		return os.path.join(self.base, *relpath.split('/'))
+
+	def hash(self, path: str) -> str:
+		if self.cache is not None:
+			return self.cache.fingerprint(path)
+		return hash_file(path)
+
+	def set_main(self, main_path: str, sprite_name: str):
+		self.load()['main'] = {
+			'path': self.get_relpath(main_path),
+			'sprite': sprite_name,
+			'hash': self.hash(main_path)
+		}
+
+	def set_packages(self, packages: dict[str, tuple], present: set[str]):
+		"""Records `packages`, name -> (path, package) in the order they were
+		merged. Entries of other packages are kept for as long as they are in
+		`present`, the packages the main project still has."""
+		lock = self.load()
+		entries = {
+			name: entry for name, entry in lock['packages'].items()
+			if name in present and name not in packages
+		}
+		for name, (path, pkg_sprite) in packages.items():
+			entries[name] = {
+				'path': self.get_relpath(path),
+				'version': pkg_sprite.package_json['version'],
+				'hash': self.hash(path),
+				'digest': pkg_sprite.get_digest()
+			}
+		lock['packages'] = entries
+
+	def verify(self, main_path: str, pkg_paths: list[str],
+	           sprite_name: str = None) -> list[str]:
+		"""What changed since the lock was written, without parsing any
+		project. Nothing means merging would give the same main project."""
+		if not os.path.exists(self.path):
+			return [f'{self.path} does not exist']
+		lock = self.load()
+		main = lock['main']
+		if main is None or main['path'] != self.get_relpath(main_path):
+			return [f'{self.path} is not the lock of {main_path}']
+		problems = []
+		if sprite_name is not None and sprite_name != main['sprite']:
+			problems.append(f'{self.path} was written for sprite {main["sprite"]}')
+		locked = {x['path'] for x in lock['packages'].values()}
+		for path in pkg_paths:
+			if self.get_relpath(path) not in locked:
+				problems.append(f'{path} is not in {self.path}')
+		for name, entry in lock['packages'].items():
+			path = self.get_path(entry['path'])
+			if not os.path.exists(path):
+				problems.append(f'{name}: {path} is missing')
+			elif self.hash(path) != entry['hash']:
+				problems.append(f'{name}: {path} changed')
+		if not os.path.exists(main_path) or self.hash(main_path) != main['hash']:
+			problems.append(f'{main_path} changed')
+		return problems
@@ -0,0 +1,150 @@
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PHASES = ('unzip', 'parse', 'load', 'track', 'merge', 'serialize', 'zip')
+
+
+class Metrics:
+	"""Wall and CPU time per phase plus counters. Does nothing until
+	`enable` is called, the CLI enables it for --timings and --metrics-json."""
+	def __init__(self):
+		self.enabled = False
+		self.trace_memory = False
+		self.phases: dict[str, dict] = {}
+		self.counts: dict[str, int] = {}
+		# Set while the CLI profiles, workers then profile themselves too
+		self.profile = False
+		# cProfile stats files written by workers, see call_measured
+		self.worker_profiles: list[str] = []
+
+	def reset(self):
+		if self.trace_memory:
+			tracemalloc.stop()
+		self.__init__()
+
+	def enable(self, trace_memory: bool = False):
+		self.enabled = True
+		self.trace_memory = trace_memory
+		if trace_memory:
+			tracemalloc.start()
+
+	@contextmanager
+	def phase(self, name: str):
+		if not self.enabled:
+			yield
+			return
+		if self.trace_memory:
+			tracemalloc.reset_peak()
+		wall, cpu = time.perf_counter(), time.process_time()
+		try:
+			yield
+		finally:
+			phase = self.phases.setdefault(name, {
+				'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'peak_bytes': None
+			})
+			phase['wall'] += time.perf_counter() - wall
+			phase['cpu'] += time.process_time() - cpu
+			phase['calls'] += 1
+			if self.trace_memory:
+				peak = tracemalloc.get_traced_memory()[1]
+				phase['peak_bytes'] = max(phase['peak_bytes'] or 0, peak)
+
+	def count(self, name: str, n: int = 1):
+		if self.enabled:
+			self.counts[name] = self.counts.get(name, 0) + n
+
+	def get_worker_state(self) -> tuple:
+		"""What call_measured needs to record the same in a worker."""
+		return self.enabled, self.trace_memory, self.profile
+
+	def add(self, snapshot: dict):
+		"""Adds what a worker recorded, see call_measured. Wall times of
+		workers running side by side add up to more than the time taken."""
+		for name, other in snapshot['phases'].items():
+			phase = self.phases.setdefault(name, {
+				'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'peak_bytes': None
+			})
+			phase['wall'] += other['wall']
+			phase['cpu'] += other['cpu']
+			phase['calls'] += other['calls']
+			if other['peak_bytes'] is not None:
+				phase['peak_bytes'] = max(phase['peak_bytes'] or 0, other['peak_bytes'])
+		for name, n in snapshot['counts'].items():
+			self.counts[name] = self.counts.get(name, 0) + n
+		if snapshot['profile'] is not None:
+			self.worker_profiles.append(snapshot['profile'])
+
+	def collect(self, outcome: tuple):
+		"""The result of call_measured, after adding its metrics."""
+		result, snapshot = outcome
+		self.add(snapshot)
+		return result
+
+	def get_json(self) -> dict:
+		phases = {
+			name: self.phases[name]
+			for name in (*PHASES, *sorted(set(self.phases) - set(PHASES)))
+			if name in self.phases
+		}
+		return {
+			'phases': phases,
+			'counts': self.counts,
+			# ru_maxrss is in KiB on Linux
+			'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+			# Of the largest worker
+			'max_rss_children_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+		}
+
+	def get_table(self) -> str:
+		data = self.get_json()
+		lines = [f'{"phase":>10} {"wall s":>9} {"cpu s":>9} {"calls":>6} {"peak MB":>9}']
+		for name, phase in data['phases'].items():
+			peak = '' if phase['peak_bytes'] is None else f'{phase["peak_bytes"] / 1e6:.2f}'
+			lines.append(
+				f'{name:>10} {phase["wall"]:>9.4f} {phase["cpu"]:>9.4f} '
+				f'{phase["calls"]:>6} {peak:>9}'
+			)
+		for name, value in sorted(data['counts'].items()):
+			lines.append(f'{name:>10} {value}')
+		lines.append(f'{"max rss":>10} {data["max_rss_bytes"] / 1e6:.2f} MB')
+		if data['max_rss_children_bytes']:
+			lines.append(f'{"worker rss":>10} {data["max_rss_children_bytes"] / 1e6:.2f} MB')
+		return '\n'.join(lines)
+
+	def dump(self, path: str):
+		with open(path, 'w') as fp:
+			json.dump(self.get_json(), fp, indent=2)
+
+
+metrics = Metrics()
+
+
+def call_measured(state: tuple, fn, *args):
+	"""Runs `fn(*args)` in a worker process the way the parent records
+	metrics, `state` being its Metrics.get_worker_state. Returns the result
+	and what was recorded, for Metrics.collect in the parent."""
+	enabled, trace_memory, profile = state
+	metrics.reset()
+	if enabled:
+		metrics.enable(trace_memory)
+	profiler = None
+	if profile:
+		import cProfile
+		profiler = cProfile.Profile()
+		profiler.enable()
+	try:
+		result = fn(*args)
+	finally:
+		if profiler is not None:
+			profiler.disable()
+	profile_path = None
+	if profiler is not None:
+		fd, profile_path = tempfile.mkstemp(suffix='.prof')
+		os.close(fd)
+		profiler.dump_stats(profile_path)
+	return result, {'phases': metrics.phases, 'counts': metrics.counts, 'profile': profile_path}
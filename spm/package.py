@@ -1,27 +1,76 @@
+import hashlib
+from sys import intern
+from json.encoder import encode_basestring
+from graph import BlockGraph
+from metrics import metrics
 from scratch import *
 
 Self = None # Wait for Python 3.11
 OMEGA = 'Ω'
 
 
+def diff(current: dict, new: dict, owned: list, key=None) -> dict[str, list]:
+	"""Names of `new` that `current` doesn't have or has with another
+	`key`, and names of `owned` that `new` doesn't have."""
+	key = key or (lambda x: x)
+	return {
+		'added': [x for x in new if x not in current],
+		'changed': [x for x in new if x in current and key(current[x]) != key(new[x])],
+		'removed': [x for x in owned if x not in new]
+	}
+
+
 class Package(Sprite):
+	@classmethod
+	def load(cls, sb3_path: str, sprite_name: str = None) -> Self:
+		project = Project(sb3_path)
+		if sprite_name is None:
+			sprite_name = project.get_main_sprite_name()
+		sprite = project.sprites[sprite_name]
+		cls.convert_sprite(sprite)
+		return sprite
+	
 	@classmethod
 	def convert_sprite(cls, sprite: Sprite):
 		sprite.__class__ = cls
+		sprite.graph: BlockGraph = None
 		sprite.package_json: dict = {
-			'costumes': {}
+			'version': '0.0.0',
+			# name -> version spec of the packages this one needs
+			'dependencies': {},
+			# name -> {'version', 'digest', 'blocks', 'variables', 'lists',
+			# 'costumes'} of every package added, the last four list what
+			# the package owns in this sprite
+			'packages': {}
 		}
-		sprite.track()
+		with metrics.phase('track'):
+			sprite.track()
+		metrics.count('blocks', len(sprite.blocks))
+		metrics.count('variables', len(sprite.variables))
+		metrics.count('lists', len(sprite.lists))
+		metrics.count('costumes', len(sprite.costumes))
 		if 'package_json' not in sprite.blocks:
 			raise Exception('16')
 	
+	def __getstate__(self) -> dict:
+		# Cheaper to build again than to pickle
+		return {**self.__dict__, 'graph': None}
+	
 	def get_json(self):
 		self.blocks['package_json']['parent'] = json.dumps(self.package_json)
 		return super().get_json()
 	
+	def get_graph(self) -> BlockGraph:
+		if self.graph is None:
+			self.graph = BlockGraph(self.blocks)
+		return self.graph
+	
 	def track(self):
 		if 'package_json' in self.blocks:
-			self.package_json = json.loads(self.blocks['package_json']['parent'])
+			self.package_json = {
+				**self.package_json,
+				**json.loads(self.blocks['package_json']['parent'])
+			}
 		else:
 			self.blocks['package_json'] = {
 				'opcode': '',
@@ -32,110 +81,381 @@ class Package(Sprite):
 				'shadow': True,
 				'topLevel': False
 			}
-		for costume in self.costumes.values():
-			if costume.name not in self.package_json['costumes']:
-				self.package_json['costumes'][costume.name] = self.name
-		self.package_json['costumes'] = {
-			a:b
-			for a,b in self.package_json['costumes'].items()
-			if a in self.costumes
+		self.track_block_ids()
+		return self.track_owners()
+	
+	def track_owners(self):
+		packages = self.package_json['packages']
+		# Older package_json only had a costume -> owner map, rebuild the
+		# index from it and from the block ID tags.
+		legacy = {
+			name for name, owned in packages.items()
+			if 'blocks' not in owned
 		}
-		return self.track_block_ids()
+		for costume_name, owner in self.package_json.pop('costumes', {}).items():
+			if owner != self.name:
+				legacy.add(owner)
+				self.get_owned(owner)['costumes'].append(costume_name)
+		if legacy:
+			for name in legacy:
+				self.get_owned(name)
+			for id in self.blocks:
+				owner = id.split(OMEGA)[0]
+				if OMEGA in id and owner in legacy:
+					packages[owner]['blocks'].append(id)
+		# Drop whatever was deleted in the editor
+		for owned in packages.values():
+			owned['blocks'] = [x for x in owned['blocks'] if x in self.blocks]
+			owned['variables'] = [x for x in owned['variables'] if x in self.variables]
+			owned['lists'] = [x for x in owned['lists'] if x in self.lists]
+			owned['costumes'] = [x for x in owned['costumes'] if x in self.costumes]
+		return self
+	
+	def get_owned(self, pkg_name: str) -> dict:
+		owned = self.package_json['packages'].setdefault(pkg_name, {})
+		for key in ('version', 'digest'):
+			owned.setdefault(key, None)
+		for key in ('blocks', 'variables', 'lists', 'costumes'):
+			owned.setdefault(key, [])
+		return owned
 	
-	def get_blocks_except_pkg(self, pkg_name: str) -> dict[str, dict]:
+	def get_self_pkg_blocks(self, pkg_name: str) -> dict[str, dict]:
+		graph = self.get_graph()
+		# Procedures with '#' in their name stay out, with their scripts
+		hidden = {
+			id
+			for proccode, definitions in graph.definitions.items() if '#' in proccode
+			for top in definitions for id in graph.get_subtree(top)
+		}
+		tag = pkg_name + OMEGA
 		return {
-			id:block for id,block in self.blocks.items()
-			if not id.startswith(pkg_name)
+			id: block for id, block in self.blocks.items()
+			if id.startswith(tag) and id not in hidden
 		}
 	
-	def get_self_pkg_blocks(self, pkg_name: str) -> dict[str, dict]:
+	def get_digest(self) -> str:
+		"""Hash of everything `add` takes from this package."""
+		if getattr(self, 'digest', None) is None:
+			content = [
+				self.get_self_pkg_blocks(self.name),
+				{var.id: [var.name, var.value] for var in self.variables.values()},
+				{lst.id: [lst.name, lst.value] for lst in self.lists.values()},
+				[costume.get_json() for costume in self.costumes.values()]
+			]
+			self.digest = hashlib.sha256(
+				json.dumps(content, sort_keys=True, ensure_ascii=False).encode()
+			).hexdigest()
+		return self.digest
+	
+	def get_package_info(self) -> dict:
 		return {
-			id:block for id,block in self.blocks.items()
-			if id.startswith(self.name)
-			# Remove blocks with '#' in name:
-			and not (
-				block['opcode'] == 'procedures_definition'
-				and '#' in self.blocks[block['inputs']['custom_block'][1]]['mutation']['proccode']
-			)
+			'version': self.package_json['version'],
+			'digest': self.get_digest()
 		}
 	
-	def add(self, pkg_sprite: Self):
-		self.variables = {**self.variables, **pkg_sprite.variables}
-		self.lists = {**self.lists, **pkg_sprite.lists}
-		self.costumes = {
-			name:costume
-			for name,costume in self.costumes.items()
-			if name not in self.package_json['costumes']
+	def is_up_to_date(self, pkg_sprite: Self) -> bool:
+		owned = self.package_json['packages'].get(pkg_sprite.name, {})
+		shaken = owned.get('shaken')
+		# Older versions only marked a package as shaken
+		if shaken is True:
+			return False
+		# A procedure shaken out is called again, it has to come back
+		if shaken and not self.get_graph().callers.keys().isdisjoint(shaken):
+			return False
+		return all(
+			owned.get(key) == value
+			for key, value in pkg_sprite.get_package_info().items()
+		)
+	
+	def add(self, pkg_sprite: Self) -> dict:
+		"""Adds the package in `pkg_sprite`, or updates the copy this sprite
+		has. Only the blocks, variables, lists and costumes that differ from
+		that copy are touched, everything else stays where it is. Returns
+		the version before and after, and for each of those four the names
+		that were 'added', 'changed' and 'removed'."""
+		if self.is_up_to_date(pkg_sprite):
+			return {}
+		packages = self.package_json['packages']
+		previous = packages.get(pkg_sprite.name)
+		owned = self.get_owned(pkg_sprite.name)
+		# Anything another package also brought in stays
+		shared = {
+			key: {x for name, other in packages.items() if name != pkg_sprite.name for x in other.get(key, [])}
+			for key in ('variables', 'lists', 'costumes')
 		}
-		for costume in pkg_sprite.costumes.values():
-			self.add_costume(costume, f'{pkg_sprite.project.unpacked.name}/{costume.md5ext}')
-			self.package_json['costumes'][costume.name] = pkg_sprite.name
-		self.blocks = {
-			**self.get_blocks_except_pkg(pkg_sprite.name),
-			**pkg_sprite.get_self_pkg_blocks(pkg_sprite.name)
+		blocks = pkg_sprite.get_self_pkg_blocks(pkg_sprite.name)
+		delta = {
+			'version': [previous and previous['version'], pkg_sprite.package_json['version']],
+			'blocks': diff(self.blocks, blocks, owned['blocks']),
+			'variables': diff(
+				self.variables, pkg_sprite.variables, owned['variables'],
+				lambda x: (x.id, x.value, x.is_cloud)
+			),
+			'lists': diff(
+				self.lists, pkg_sprite.lists, owned['lists'], lambda x: (x.id, x.value)
+			),
+			'costumes': diff(
+				self.costumes, pkg_sprite.costumes, owned['costumes'], Costume.get_json
+			),
 		}
-		return self
+		# Values move over, NaN in them has to be written as it was read
+		self.project.nonfinite = self.project.nonfinite or pkg_sprite.project.nonfinite
+		update = {
+			id: blocks[id]
+			for key in ('added', 'changed') for id in delta['blocks'][key]
+		}
+		if self.graph is None:
+			for id in delta['blocks']['removed']:
+				self.blocks.pop(id, None)
+			self.blocks.update(update)
+		else:
+			self.graph.remove(delta['blocks']['removed'])
+			self.graph.add(update)
+		for key, items in (('variables', self.variables), ('lists', self.lists)):
+			new = getattr(pkg_sprite, key)
+			change = delta[key]
+			for name in change['added'] + change['changed']:
+				items[name] = new[name]
+			change['removed'] = [x for x in change['removed'] if x not in shared[key]]
+			for name in change['removed']:
+				items.pop(name, None)
+			owned[key] = [x for x in new if x in owned[key] or x in change['added']]
+		costume_names = list(self.costumes)
+		current = self.json.get('currentCostume', 0)
+		change = delta['costumes']
+		for name in change['added'] + change['changed']:
+			costume = pkg_sprite.costumes[name]
+			self.add_costume(costume, pkg_sprite.project.assets.get(costume.md5ext))
+		change['removed'] = [
+			x for x in change['removed']
+			if x not in shared['costumes'] and x in self.costumes
+		]
+		for name in change['removed']:
+			self.remove_costume(name)
+		if 0 <= current < len(costume_names) and costume_names[current] in self.costumes:
+			self.json['currentCostume'] = list(self.costumes).index(costume_names[current])
+		owned['costumes'] = list(pkg_sprite.costumes)
+		owned['blocks'] = list(blocks)
+		owned.update(pkg_sprite.get_package_info())
+		# Whatever was shaken out is back
+		owned.pop('shaken', None)
+		return delta
 	
 	def remove(self, pkg_name: str):
-		self.blocks = self.get_blocks_except_pkg(pkg_name)
-		for costume_name in self.package_json[pkg_name]['costumes']:
-			self.remove_costume(costume_name)
-		self.package_json['costumes'] = {
-			a:b
-			for a,b in self.package_json['costumes']
-			if a != pkg_name
+		packages = self.package_json['packages']
+		if pkg_name not in packages:
+			raise KeyError(f'"{pkg_name}" is not a package of {self.name}')
+		owned = self.get_owned(pkg_name)
+		packages.pop(pkg_name)
+		if self.graph is None:
+			for id in owned['blocks']:
+				self.blocks.pop(id, None)
+		else:
+			self.graph.remove(owned['blocks'])
+		# Anything another package also brought in stays
+		shared = {
+			key: {x for other in packages.values() for x in other.get(key, [])}
+			for key in ('variables', 'lists', 'costumes')
 		}
+		for name in owned['variables']:
+			if name not in shared['variables']:
+				self.variables.pop(name, None)
+		for name in owned['lists']:
+			if name not in shared['lists']:
+				self.lists.pop(name, None)
+		costume_names = list(self.costumes)
+		current = self.json.get('currentCostume', 0)
+		for name in owned['costumes']:
+			if name not in shared['costumes'] and name in self.costumes:
+				self.remove_costume(name)
+		if 0 <= current < len(costume_names) and costume_names[current] in self.costumes:
+			self.json['currentCostume'] = list(self.costumes).index(costume_names[current])
+		else:
+			# The costume went with the package
+			self.json['currentCostume'] = 0
 		return self
 	
+	def get_referenced_names(self) -> tuple[set[str], set[str]]:
+		"""Names of the variables and lists blocks of this sprite use, and
+		those other sprites read through "of" blocks or monitors show."""
+		variables, lists = self.get_graph().get_references()
+		# Other sprites are read from their JSON, building them isn't needed
+		for target in self.project.sprites.targets.values():
+			for block in target['blocks'].values():
+				if type(block) is dict and block['opcode'] == 'sensing_of':
+					variables.add(block['fields']['PROPERTY'][0])
+		for monitor in self.project.json.get('monitors', []):
+			if monitor.get('spriteName') == self.name:
+				params = monitor.get('params', {})
+				variables.add(params.get('VARIABLE'))
+				lists.add(params.get('LIST'))
+		return variables, lists
+	
+	def get_referenced_costumes(self, ids=None) -> set[str]:
+		"""Costume names blocks, `ids` or all of them, switch to. None when a
+		costume is picked by anything but its name in a menu so any of them
+		could be used."""
+		names = set()
+		for block in self.blocks.values() if ids is None else map(self.blocks.get, ids):
+			if type(block) is not dict:
+				continue
+			opcode = block['opcode']
+			if opcode == 'looks_costume':
+				names.add(block['fields']['COSTUME'][0])
+			elif opcode == 'looks_nextcostume':
+				return None
+			elif opcode == 'looks_switchcostumeto':
+				menu = block['inputs'].get('COSTUME', [1, None])
+				if menu[0] != 1:
+					return None
+		return names
+	
+	def tree_shake(self) -> dict[str, dict]:
+		"""Removes the procedures of packages that nothing calls, then the
+		package variables, lists and costumes only they used. Every script
+		that isn't a package procedure definition is a root. Returns package
+		name -> what was removed from it.
+
+		The proccodes removed are kept in 'shaken' of the packages affected,
+		they are only merged again when their digest changes or one of
+		those procedures is called again."""
+		packages = self.package_json['packages']
+		owners = {
+			id: name for name, owned in packages.items()
+			for id in owned['blocks']
+		}
+		graph = self.get_graph()
+		definitions = {id for ids in graph.definitions.values() for id in ids}
+		reached = graph.get_reachable(graph.tops - (definitions & owners.keys()))
+		report = {}
+		def get_report(name: str) -> dict:
+			return report.setdefault(name, {
+				'procedures': [], 'blocks': 0, 'variables': [], 'lists': [], 'costumes': []
+			})
+		dead = []
+		# In block order, the set's would change between runs
+		for top in [x for x in self.blocks if x in graph.tops and x not in reached]:
+			ids = graph.get_subtree(top)
+			entry = get_report(owners[top])
+			entry['procedures'].append(graph.proccodes.get(top))
+			entry['blocks'] += len(ids)
+			dead += ids
+		if not dead:
+			return report
+		# Only what the removed scripts used can have become unused
+		used_variables, used_lists = graph.get_references(dead)
+		used_costumes = self.get_referenced_costumes(dead)
+		graph.remove(dead)
+		for name in report:
+			owned = packages[name]
+			owned['blocks'] = [x for x in owned['blocks'] if x in self.blocks]
+		variables, lists = self.get_referenced_names()
+		costumes = self.get_referenced_costumes()
+		costume_names = list(self.costumes)
+		current = self.json.get('currentCostume', 0)
+		if 0 <= current < len(costume_names) and costumes is not None:
+			costumes.add(costume_names[current])
+		for name, owned in packages.items():
+			for var in owned['variables']:
+				if var in used_variables and var not in variables and var in self.variables:
+					self.variables.pop(var)
+					get_report(name)['variables'].append(var)
+			for lst in owned['lists']:
+				if lst in used_lists and lst not in lists and lst in self.lists:
+					self.lists.pop(lst)
+					get_report(name)['lists'].append(lst)
+			for costume in owned['costumes']:
+				if (
+					costumes is not None and costume not in costumes and costume in self.costumes
+					and (used_costumes is None or costume in used_costumes)
+				):
+					self.remove_costume(costume)
+					get_report(name)['costumes'].append(costume)
+			owned['variables'] = [x for x in owned['variables'] if x in self.variables]
+			owned['lists'] = [x for x in owned['lists'] if x in self.lists]
+			owned['costumes'] = [x for x in owned['costumes'] if x in self.costumes]
+		# A package that lost variables to another's procedures comes back
+		# with them too
+		removed = {x for entry in report.values() for x in entry['procedures'] if x is not None}
+		for name in report:
+			shaken = packages[name].get('shaken')
+			packages[name]['shaken'] = sorted(removed.union(shaken if type(shaken) is list else []))
+		if 0 <= current < len(costume_names):
+			self.json['currentCostume'] = list(self.costumes).index(costume_names[current])
+		return report
+	
 	def track_block_ids(self):
-		OMEGA = 'Ω'
+		"""Tags every block ID with the sprite's name, IDs which already have a
+		tag are kept. The new IDs are worked out once into a remap table that
+		is then applied in a single pass over blocks and comments."""
 		tag = self.name + OMEGA
-		self.var = {
-			var.name: var
-			for name, var in self.variables.items()
-		}
 		for var in self.variables.values():
 			var.id = var.name
-		self.lists = {
-			lst.name: lst
-			for name, lst in self.lists.items()
-		}
 		for lst in self.lists.values():
 			lst.id = lst.name
-		self.blocks = {
-			(tag+key) if (key.count(OMEGA) == 0 and key != 'package_json')
-			else key: value
-			for key, value in self.blocks.items()
-		}
-		for bid, block in self.blocks.items():
-			if bid == 'package_json': continue
-			# I am not going to bother refactor this...
+		remap = {'package_json': 'package_json'}
+		for id in self.blocks:
+			if id not in remap:
+				remap[id] = id if OMEGA in id else tag + id
+		def retag(id: str) -> str:
+			new = remap.get(id)
+			if new is None:
+				# Argument IDs aren't blocks, they get tagged the same way
+				new = remap[id] = id if OMEGA in id else tag + id
+			return new
+		# argumentids is JSON in a string, calls share it with the prototype
+		argumentids = {}
+		def retag_argumentids(ids: str) -> str:
+			new = argumentids.get(ids)
+			if new is None:
+				# Same output as json.dumps(..., ensure_ascii=False)
+				new = argumentids[ids] = '[' + ', '.join(
+					encode_basestring(retag(x)) for x in json.loads(ids)
+				) + ']'
+			return new
+		blocks = {}
+		for id, block in self.blocks.items():
+			blocks[remap[id]] = block
+			# Top level variable and list reporters
 			if type(block) is list:
 				block[2] = block[1]
 				continue
-			if block['next'] is not None and block['next'].count(OMEGA) == 0:
-				block['next'] = tag+block['next']
-			if block['parent'] is not None and block['parent'].count(OMEGA) == 0:
-				block['parent'] = tag+block['parent']
-			for input in block['inputs'].values():
-				if input[0] in (1,2,3) and type(input[1]) is str and input[1].count(OMEGA) == 0:
-					input[1] = tag+input[1]
-				if input[0] == 3 and type(input[1]) is list and input[1][0] == 12:
-					input[1][2] = input[1][1]
-			if ( block['opcode'] == 'procedures_definition'
-				 and block['inputs']['custom_block'][1].count(OMEGA) == 0 ):
-				block['inputs']['custom_block'][1] = tag+block['inputs']['custom_block'][1]
-			elif block['opcode'] in ('procedures_prototype', 'procedures_call'):
-				block['mutation']['argumentids'] = json.dumps([
-					tag+x if x.count(OMEGA) == 0 else x
-					for x in json.loads(block['mutation']['argumentids'])
-				], ensure_ascii=False) # aaaaaaaaaaaaaaaaa
-				block['inputs'] = {
-					(tag+key) if key.count(OMEGA) == 0 else key: value
-					for key, value in block['inputs'].items()
+			if id == 'package_json':
+				continue
+			# A few hundred opcodes are repeated over every block
+			block['opcode'] = intern(block['opcode'])
+			next, parent = block['next'], block['parent']
+			if next is not None:
+				block['next'] = remap.get(next) or retag(next)
+			if parent is not None:
+				block['parent'] = remap.get(parent) or retag(parent)
+			inputs = block['inputs']
+			if block['opcode'] in ('procedures_prototype', 'procedures_call'):
+				mutation = block['mutation']
+				mutation['argumentids'] = retag_argumentids(mutation['argumentids'])
+				inputs = block['inputs'] = {
+					retag(key): value
+					for key, value in inputs.items()
 				}
-				if block['opcode'] == 'procedures_prototype':
-					for input in block['inputs'].values():
-						if input[1].count(OMEGA) == 0:
-							input[1] = tag+input[1]
+			# [shadow type, block or primitive, obscured shadow]
+			for input in inputs.values():
+				value = input[1]
+				if type(value) is str:
+					input[1] = remap.get(value) or retag(value)
+				elif value is not None and value[0] in (12, 13):
+					value[2] = value[1]
+				if len(input) > 2 and type(input[2]) is str:
+					input[2] = remap.get(input[2]) or retag(input[2])
+			fields = block['fields']
+			if fields:
+				for name in ('VARIABLE', 'LIST'):
+					if name in fields and len(fields[name]) > 1:
+						fields[name][1] = fields[name][0]
+		# The parsed dict and its untagged keys would stay alive through
+		# self.json until get_json otherwise
+		self.blocks = self.json['blocks'] = blocks
+		self.graph = None
+		for comment in self.comments.values():
+			if comment.block_id is not None:
+				comment.block_id = retag(comment.block_id)
 		return self
@@ -0,0 +1,120 @@
+import json
+import os
+
+from archive import atomic_write
+from cache import hash_file
+
+INDEX_VERSION = 1
+INDEX_NAME = '.spm-index.json'
+
+
+class Registry:
+	"""A directory of packages, spm-modules by default, and an index of what
+	each one is: name, version, dependencies, sha256 and digest, how many
+	blocks it adds and its costumes and assets. Lookups only read the
+	index, a package is loaded again when its size or mtime changed.
+
+	`load(paths)` returns the packages of `paths` in order, each one the
+	sprite named after its file as with dependencies."""
+	def __init__(self, path: str, load):
+		self.path = path
+		self.load = load
+		self.index_path = os.path.join(path, INDEX_NAME)
+		# file name -> entry
+		self.entries: dict[str, dict] = None
+
+	def load_index(self) -> dict[str, dict]:
+		try:
+			with open(self.index_path, 'r') as fp:
+				index = json.load(fp)
+		except (FileNotFoundError, ValueError):
+			return {}
+		return index['packages'] if index.get('version') == INDEX_VERSION else {}
+
+	def save_index(self):
+		index = {'version': INDEX_VERSION, 'packages': self.entries}
+		atomic_write(self.index_path, json.dumps(index, indent='\t').encode())
+
+	def get_entry(self, path: str, stat: os.stat_result, pkg_sprite) -> dict:
+		return {
+			'size': stat.st_size,
+			'mtime': stat.st_mtime_ns,
+			'name': pkg_sprite.name,
+			'version': pkg_sprite.package_json['version'],
+			'dependencies': pkg_sprite.package_json['dependencies'],
+			'hash': hash_file(path),
+			'digest': pkg_sprite.get_digest(),
+			'blocks': len(pkg_sprite.get_self_pkg_blocks(pkg_sprite.name)),
+			'costumes': list(pkg_sprite.costumes),
+			'assets': [x.md5ext for x in pkg_sprite.costumes.values()]
+		}
+
+	def update(self) -> dict[str, dict]:
+		"""Brings the index up to date with the directory, only packages
+		added or changed since it was written are loaded."""
+		if self.entries is not None:
+			return self.entries
+		if not os.path.isdir(self.path):
+			self.entries = {}
+			return self.entries
+		old = self.load_index()
+		stats = {
+			entry.name: entry.stat()
+			for entry in os.scandir(self.path)
+			if entry.is_file() and entry.name.endswith('.sb3')
+		}
+		self.entries = {}
+		changed = []
+		for file_name in sorted(stats):
+			entry, stat = old.get(file_name), stats[file_name]
+			if entry is not None and [entry['size'], entry['mtime']] == [stat.st_size, stat.st_mtime_ns]:
+				self.entries[file_name] = entry
+			else:
+				changed.append(file_name)
+		if changed:
+			paths = [os.path.join(self.path, x) for x in changed]
+			try:
+				loaded = self.load(paths)
+			except Exception:
+				loaded = None
+			for i, file_name in enumerate(changed):
+				stat = stats[file_name]
+				try:
+					pkg_sprite = self.load([paths[i]])[0] if loaded is None else loaded[i]
+					self.entries[file_name] = self.get_entry(paths[i], stat, pkg_sprite)
+				except Exception as e:
+					# Kept so a broken file isn't loaded again until it changes
+					self.entries[file_name] = {
+						'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+						'error': f'{type(e).__name__}: {e}'
+					}
+			self.entries = dict(sorted(self.entries.items()))
+		if changed or old.keys() != self.entries.keys():
+			try:
+				self.save_index()
+			except OSError:
+				# A read only registry still resolves, only more slowly
+				pass
+		return self.entries
+
+	def get_packages(self) -> dict[str, dict]:
+		"""name -> entry of every package, with its 'path'."""
+		packages = {}
+		for file_name, entry in self.update().items():
+			if 'error' in entry:
+				continue
+			if entry['name'] in packages:
+				raise ValueError(
+					f'Package "{entry["name"]}" is in both '
+					f'{packages[entry["name"]]["path"]} and {file_name}'
+				)
+			packages[entry['name']] = {**entry, 'path': os.path.join(self.path, file_name)}
+		return packages
+
+	def get(self, name: str) -> dict:
+		"""Entry of package `name`, None if it isn't here."""
+		entries = self.update()
+		entry = entries.get(f'{name}.sb3')
+		if entry is not None and entry.get('name') == name:
+			return {**entry, 'path': os.path.join(self.path, f'{name}.sb3')}
+		return self.get_packages().get(name)
@@ -0,0 +1,178 @@
+import os
+import re
+
+from package import Package
+from registry import Registry
+
+VERSION = re.compile(r'\d+(\.\d+)*')
+# Comparisons allowed in a dependency's version spec, e.g. '>=1.2, <2'
+OPERATORS = {
+	'==': lambda a, b: a == b,
+	'!=': lambda a, b: a != b,
+	'>=': lambda a, b: a >= b,
+	'<=': lambda a, b: a <= b,
+	'>': lambda a, b: a > b,
+	'<': lambda a, b: a < b,
+}
+
+
+def parse_version(version: str) -> tuple[int, ...]:
+	"""'1.2.0' -> (1, 2), trailing zeros don't count."""
+	if not VERSION.fullmatch(version):
+		raise ValueError(f'Invalid version "{version}", expected something like 1.2.0')
+	parts = [int(x) for x in version.split('.')]
+	while len(parts) > 1 and parts[-1] == 0:
+		parts.pop()
+	return tuple(parts)
+
+
+def parse_spec(spec: str) -> list[tuple[str, tuple[int, ...]]]:
+	"""'>=1.2, <2' -> [('>=', (1, 2)), ('<', (2,))]. A bare version means
+	exactly that version, '*' or '' means any."""
+	clauses = []
+	for clause in spec.split(','):
+		clause = clause.strip()
+		if clause in ('', '*'):
+			continue
+		operator = next((x for x in OPERATORS if clause.startswith(x)), None)
+		if operator is None:
+			operator, version = '==', clause
+		else:
+			version = clause[len(operator):].strip()
+		clauses.append((operator, parse_version(version)))
+	return clauses
+
+
+def satisfies(version: str, spec: str) -> bool:
+	version = parse_version(version)
+	return all(
+		OPERATORS[operator](version, wanted)
+		for operator, wanted in parse_spec(spec)
+	)
+
+
+def sort_graph(names, get_edges, kind: str = 'Dependency') -> list[str]:
+	"""`names` and everything reached from them through `get_edges`, each
+	after those its edges lead to. Depth first in the order of `names`, so
+	the order only changes when the graph does."""
+	order = []
+	# name -> False while its edges are visited, True once done
+	visited: dict[str, bool] = {}
+	def visit(name: str, path: list[str]):
+		if visited.get(name) is False:
+			cycle = path[path.index(name):] + [name]
+			raise ValueError(f'{kind} cycle: {" -> ".join(cycle)}')
+		if name in visited:
+			return
+		visited[name] = False
+		for edge in get_edges(name):
+			visit(edge, path + [name])
+		visited[name] = True
+		order.append(name)
+	for name in names:
+		visit(name, [])
+	return order
+
+
+class Resolver:
+	"""Works out every package a project needs from the packages it is given
+	and the dependencies they declare, each package is loaded once however
+	many others depend on it. Dependencies not given are looked up by name
+	in `modules_dir` as <name>.sb3.
+
+	`load(paths, sprite_name)` returns the packages of `paths` in order,
+	each level of the graph is loaded in one call so it can load them in
+	parallel. Dependencies are the sprite named after their file.
+
+	With a `registry` over `modules_dir`, dependencies are found by package
+	name whatever their file is called, and versions are checked against
+	its index before anything is loaded."""
+	def __init__(self, load, modules_dir: str = 'spm-modules',
+	             pkg_sprite_name: str = None, registry: Registry = None):
+		self.load = load
+		self.modules_dir = modules_dir
+		self.pkg_sprite_name = pkg_sprite_name
+		self.registry = registry
+		self.packages: dict[str, Package] = {}
+		self.paths: dict[str, str] = {}
+		# name -> [(dependent name, version spec)]
+		self.required: dict[str, list[tuple[str, str]]] = {}
+		self.order: list[Package] = []
+
+	def find(self, name: str) -> str:
+		if self.registry is not None:
+			entry = self.registry.get(name)
+			if entry is not None:
+				self.check_version(name, entry['version'])
+				return entry['path']
+		path = os.path.join(self.modules_dir, f'{name}.sb3')
+		if not os.path.exists(path):
+			required_by = ', '.join(x for x, _ in self.required[name])
+			raise FileNotFoundError(
+				f'Package "{name}" needed by {required_by} is not in {self.modules_dir}'
+			)
+		return path
+
+	def add(self, path: str, pkg_sprite: Package, name: str = None):
+		if name is not None and pkg_sprite.name != name:
+			raise ValueError(f'{path} has package "{pkg_sprite.name}", expected "{name}"')
+		other = self.packages.get(pkg_sprite.name)
+		if other is not None and other.get_digest() != pkg_sprite.get_digest():
+			raise ValueError(
+				f'Conflicting copies of package "{pkg_sprite.name}" in '
+				f'{self.paths[pkg_sprite.name]} and {path}'
+			)
+		if other is None:
+			self.packages[pkg_sprite.name] = pkg_sprite
+			self.paths[pkg_sprite.name] = path
+
+	def get_dependencies(self, pkg_sprite: Package) -> dict[str, str]:
+		return pkg_sprite.package_json.get('dependencies', {})
+
+	def resolve(self, pkg_paths: list[str], dependencies: dict[str, str] = None,
+	            dependent: str = None) -> list[Package]:
+		"""Loads `pkg_paths`, the packages named in `dependencies` and all
+		of their dependencies, returns them with every package after the
+		ones it depends on."""
+		for path, pkg_sprite in zip(pkg_paths, self.load(pkg_paths, self.pkg_sprite_name)):
+			self.add(path, pkg_sprite)
+		for name, spec in (dependencies or {}).items():
+			self.required.setdefault(name, []).append((dependent, spec))
+		pending = [*self.packages.values()]
+		while True:
+			for pkg_sprite in pending:
+				for name, spec in self.get_dependencies(pkg_sprite).items():
+					self.required.setdefault(name, []).append((pkg_sprite.name, spec))
+			missing = [name for name in self.required if name not in self.packages]
+			if not missing:
+				break
+			paths = [self.find(name) for name in missing]
+			pending = self.load(paths, None)
+			for name, path, pkg_sprite in zip(missing, paths, pending):
+				self.add(path, pkg_sprite, name)
+		self.check_versions()
+		self.order = self.sort()
+		return self.order
+
+	def check_version(self, name: str, version: str):
+		unmet = [
+			f'{dependent} needs {spec}'
+			for dependent, spec in self.required[name]
+			if not satisfies(version, spec)
+		]
+		if unmet:
+			raise ValueError(
+				f'Package "{name}" is version {version} but {", ".join(unmet)}'
+			)
+
+	def check_versions(self):
+		for name in self.required:
+			self.check_version(name, self.packages[name].package_json['version'])
+
+	def sort(self) -> list[Package]:
+		"""Every package after the ones it depends on."""
+		return [
+			self.packages[name] for name in sort_graph(
+				self.packages, lambda name: self.get_dependencies(self.packages[name])
+			)
+		]
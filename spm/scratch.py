@@ -1,45 +1,148 @@
 import json
 import os
-import tempfile
-from zipfile import Zip
+from collections.abc import Mapping
+import jsonlib
+from archive import Archive, ArchiveWriter
+from metrics import metrics
+from store import AssetStore
 
 
 class Project:
 	def __init__(self, sb3_path: str):
 		self.name = sb3_path.split('/')[-1].replace('.sb3','')
-		self.sprites: dict[str, Sprite]
-		self.unpacked = tempfile.TemporaryDirectory()
+		self.sprites: Sprites
+		# md5ext -> archive the asset is read from on export
+		self.assets: dict[str, Archive] = {}
 		self.load_sb3(sb3_path)
 	
 	def load_sb3(self, sb3_path: str):
-		Zip.unzip(sb3_path, self.unpacked.name)
-		with open(f'{self.unpacked.name}/project.json', 'r') as fp:
-			self.json = json.loads(fp.read())
-		self.load_attributes()
+		with metrics.phase('unzip'):
+			self.archive = Archive(sb3_path)
+			data = self.archive.read('project.json')
+			self.assets = {
+				name: self.archive
+				for name in self.archive.names()
+				if name != 'project.json'
+			}
+		metrics.count('bytes_read', len(data))
+		with metrics.phase('parse'):
+			self.json, self.nonfinite = jsonlib.parse(data)
+		with metrics.phase('load'):
+			self.load_attributes()
 		return self
 
-	def export_sb3(self, sb3_path: str):
-		with open(f'{self.unpacked.name}/project.json', 'w') as fp:
-			fp.write(json.dumps(self.get_json(), ensure_ascii=False))
-		Zip.zip(self.unpacked.name, sb3_path)
+	def __enter__(self):
 		return self
+	
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+	
+	def close(self):
+		"""Closes the archives the project reads from. They are opened again
+		if anything is read from them later."""
+		archives = {id(x): x for x in [self.archive, *self.assets.values()]}
+		for archive in archives.values():
+			archive.close()
+	
+	def export_sb3(self, sb3_path: str, recompress: bool = False):
+		# Unless `recompress` is set, assets are copied from their source
+		# archive as they are and only project.json is compressed.
+		with metrics.phase('serialize'):
+			data = jsonlib.dumps(self.get_json(), self.nonfinite)
+		with metrics.phase('zip'):
+			names = self.get_asset_names()
+			with ArchiveWriter(sb3_path) as out:
+				out.write('project.json', data)
+				for name in names:
+					out.copy(self.assets[name], name, raw=not recompress)
+		metrics.count('bytes_written', os.path.getsize(sb3_path))
+		# The archives assets came from are opened again by path, by then
+		# a package may have been replaced. The file just written has them.
+		self.close()
+		self.archive = Archive(sb3_path)
+		self.assets = {name: self.archive for name in names}
+		return self
+	
+	def unpack(self, directory: str, store: AssetStore):
+		"""Writes project.json and the assets into `directory`. Assets are
+		put into `store` once and reflinked or copied from there."""
+		os.makedirs(directory, exist_ok=True)
+		with metrics.phase('serialize'):
+			data = jsonlib.dumps(self.get_json(), self.nonfinite)
+		with open(f'{directory}/project.json', 'wb') as fp:
+			fp.write(data)
+		with metrics.phase('materialise'):
+			for name in self.get_asset_names():
+				if not store.check(name):
+					store.put(name, self.assets[name].read(name))
+				store.materialise(name, f'{directory}/{name}')
+		return self
+	
+	def get_asset_names(self) -> list[str]:
+		"""Assets the targets use. Those missing from the project are left
+		out and counted instead of failing the export."""
+		names = dict.fromkeys(
+			asset['md5ext']
+			for target in self.json['targets']
+			for asset in target['costumes'] + target['sounds']
+		)
+		missing = [x for x in names if x not in self.assets]
+		if missing:
+			metrics.count('missing_assets', len(missing))
+		return [x for x in names if x in self.assets]
+
+	def get_main_sprite_name(self) -> str:
+		if self.name in self.sprites and self.name != 'Stage':
+			return self.name
+		else:
+			return next(filter(lambda x: x != 'Stage', self.sprites))
 
 	def load_attributes(self):
-		self.sprites = {
-			sprite['name']: Sprite(sprite, self)
-			for sprite in self.json['targets']
-		}
+		self.sprites = Sprites(self)
 		return self
 	
 	def get_json(self):
-		self.json['targets'] = [
-			sprite.get_json()
-			for sprite in self.sprites.values()
-		]
+		self.json['targets'] = self.sprites.get_json()
 		return self.json
 
 
+class Sprites(Mapping):
+	"""name -> Sprite of every target, a Sprite is only built the first time
+	it is looked up. Targets nobody looked up are exported as they were
+	parsed."""
+	def __init__(self, project: Project):
+		self.project = project
+		self.targets: dict[str, dict] = {
+			target['name']: target
+			for target in project.json['targets']
+		}
+		self.loaded: dict[str, Sprite] = {}
+	
+	def __getitem__(self, name: str) -> 'Sprite':
+		sprite = self.loaded.get(name)
+		if sprite is None:
+			sprite = self.loaded[name] = Sprite(self.targets[name], self.project)
+		return sprite
+	
+	def __contains__(self, name) -> bool:
+		return name in self.targets
+	
+	def __iter__(self):
+		return iter(self.targets)
+	
+	def __len__(self) -> int:
+		return len(self.targets)
+	
+	def get_json(self) -> list[dict]:
+		return [
+			self.loaded[name].get_json() if name in self.loaded else target
+			for name, target in self.targets.items()
+		]
+
+
 class Variable:
+	__slots__ = ('id', 'name', 'value', 'is_cloud')
+
 	def __init__(self, id, name, value, is_cloud=False):
 		self.id: str = id
 		self.name: str = name
@@ -48,6 +151,8 @@ class Variable:
 
 
 class List:
+	__slots__ = ('id', 'name', 'value')
+
 	def __init__(self, id, name, value):
 		self.id: str = id
 		self.name: str = name
@@ -55,6 +160,8 @@ class List:
 
 
 class Comment:
+	__slots__ = ('id', 'block_id', 'x', 'y', 'width', 'height', 'minimized', 'text')
+
 	def __init__(self, id, blockId, x, y, width, height, minimized, text):
 		self.id: str = id
 		self.block_id: str = blockId
@@ -67,6 +174,11 @@ class Comment:
 
 
 class Costume:
+	__slots__ = (
+		'asset_id', 'name', 'bitmap_resolution', 'md5ext', 'data_format',
+		'rotation_center_x', 'rotation_center_y'
+	)
+
 	def __init__(self, assetId, name, md5ext, dataFormat, rotationCenterX,
 	             rotationCenterY, bitmapResolution=None
 				):
@@ -94,6 +206,11 @@ class Costume:
 
 
 class Sound:
+	__slots__ = (
+		'asset_id', 'name', 'data_format', 'format', 'rate', 'sample_count',
+		'md5ext'
+	)
+
 	def __init__(self, assetId, name, dataFormat, format, rate, sampleCount,
 	             md5ext):
 		self.asset_id: str = assetId
@@ -124,7 +241,7 @@ class Sprite:
 	def get_json(self):
 		self.json['isStage'] = self.is_stage
 		self.json['variables'] = {
-			var.id: [var.name, var.value]
+			var.id: [var.name, var.value, True] if var.is_cloud else [var.name, var.value]
 			for var in self.variables.values()
 		}
 		self.json['lists'] = {
@@ -193,13 +310,14 @@ class Sprite:
 		raise NotImplemented
 		return self
 	
-	def add_costume(self, costume: Costume, costume_path):
+	def add_costume(self, costume: Costume, archive: Archive):
 		self.costumes[costume.name] = costume
-		os.system(f"cp '{costume_path}' '{self.project.unpacked.name}'")
+		if archive is not None:
+			self.project.assets[costume.md5ext] = archive
 		return self
 	
 	def remove_costume(self, costume_name: str):
-		os.system(f"rm '{self.project.unpacked.name}/{self.costumes[costume_name].md5ext}'")
+		# Assets no costume refers to are left out by Project.export_sb3
 		self.costumes.pop(costume_name)
 		return self
 	
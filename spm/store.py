@@ -0,0 +1,109 @@
+import hashlib
+import os
+import shutil
+
+from archive import atomic_write
+
+FICLONE = 0x40049409 # linux/fs.h
+DEFAULT_MAX_SIZE = 1 << 30
+
+
+def get_cache_dir() -> str:
+	return os.path.join(
+		os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+		'spm'
+	)
+
+
+def verify_asset(md5ext: str, data: bytes) -> bool:
+	return hashlib.md5(data).hexdigest() == md5ext.split('.')[0]
+
+
+class AssetStore:
+	"""Content-addressed store of assets, keyed by md5ext.
+	Files are kept as `<root>/<first two hex digits>/<md5ext>`, their mtime is
+	bumped on every use and `evict` drops the least recently used ones."""
+	def __init__(self, path: str = None, max_size: int = DEFAULT_MAX_SIZE):
+		self.path = os.path.join(get_cache_dir(), 'assets') if path is None else path
+		self.max_size = max_size
+
+	def get_path(self, md5ext: str) -> str:
+		if os.sep in md5ext or md5ext.startswith('.'):
+			raise ValueError(f'"{md5ext}" is not an asset name')
+		return os.path.join(self.path, md5ext[:2], md5ext)
+
+	def has(self, md5ext: str) -> bool:
+		return os.path.isfile(self.get_path(md5ext))
+
+	def touch(self, md5ext: str):
+		os.utime(self.get_path(md5ext))
+
+	def put(self, md5ext: str, data: bytes) -> str:
+		path = self.get_path(md5ext)
+		if os.path.isfile(path):
+			self.touch(md5ext)
+			return path
+		if not verify_asset(md5ext, data):
+			raise ValueError(f'Contents of "{md5ext}" do not match its md5')
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		atomic_write(path, data)
+		return path
+
+	def check(self, md5ext: str) -> bool:
+		"""Whether the store has the asset intact, a corrupt copy is removed."""
+		if not self.has(md5ext):
+			return False
+		with open(self.get_path(md5ext), 'rb') as fp:
+			if verify_asset(md5ext, fp.read()):
+				return True
+		self.discard(md5ext)
+		return False
+
+	def discard(self, md5ext: str):
+		try:
+			os.remove(self.get_path(md5ext))
+		except FileNotFoundError:
+			pass
+
+	def materialise(self, md5ext: str, dest: str):
+		"""Makes `dest` a copy of the asset, a reflink where the filesystem
+		has them and a plain copy otherwise. Never a hardlink, editing `dest`
+		in place would change the stored asset too."""
+		src = self.get_path(md5ext)
+		self.touch(md5ext)
+		if os.path.lexists(dest):
+			os.remove(dest)
+		try:
+			import fcntl
+			with open(src, 'rb') as s, open(dest, 'wb') as d:
+				fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+			return dest
+		except (ImportError, OSError):
+			if os.path.lexists(dest):
+				os.remove(dest)
+		shutil.copyfile(src, dest)
+		return dest
+
+	def entries(self) -> list[os.DirEntry]:
+		if not os.path.isdir(self.path):
+			return []
+		return [
+			entry
+			for bucket in os.scandir(self.path) if bucket.is_dir()
+			for entry in os.scandir(bucket.path) if entry.is_file()
+		]
+
+	def evict(self) -> list[str]:
+		entries = sorted(
+			((entry, entry.stat()) for entry in self.entries()),
+			key=lambda x: x[1].st_mtime
+		)
+		total = sum(stat.st_size for _, stat in entries)
+		evicted = []
+		for entry, stat in entries:
+			if total <= self.max_size:
+				break
+			os.remove(entry.path)
+			total -= stat.st_size
+			evicted.append(entry.name)
+		return evicted
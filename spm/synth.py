@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Synthetic Scratch projects for benchmarks
+  > python spm/synth.py out.sb3 [--sprites N] [--procedures N] [--blocks N]
+                        [--variables N] [--lists N] [--costumes N]
+                        [--costume-size BYTES]
+The first sprite is named after the file, so the project can be merged as a
+package straight away.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import zipfile
+
+
+def make_procedure(prefix: str, index: int, blocks: int, callee: str = None) -> dict[str, dict]:
+	"""A procedures_definition script of `blocks` blocks: prototype with an
+	argument reporter, a variable set, a call to `callee` and filler."""
+	ids = [f'{prefix}{index}_{i}' for i in range(max(blocks, 5))]
+	proccode = f'{prefix}proc{index} %s'
+	script = {
+		ids[0]: {
+			'opcode': 'procedures_definition', 'next': ids[3], 'parent': None,
+			'inputs': {'custom_block': [1, ids[1]]}, 'fields': {},
+			'shadow': False, 'topLevel': True, 'x': 0, 'y': index * 100
+		},
+		ids[1]: {
+			'opcode': 'procedures_prototype', 'next': None, 'parent': ids[0],
+			'inputs': {f'{prefix}arg{index}': [1, ids[2]]}, 'fields': {},
+			'shadow': True, 'topLevel': False,
+			'mutation': {
+				'tagName': 'mutation', 'children': [], 'proccode': proccode,
+				'argumentids': f'["{prefix}arg{index}"]', 'argumentnames': '["x"]',
+				'argumentdefaults': '[""]', 'warp': 'false'
+			}
+		},
+		ids[2]: {
+			'opcode': 'argument_reporter_string_number', 'next': None,
+			'parent': ids[1], 'inputs': {}, 'fields': {'VALUE': ['x', None]},
+			'shadow': True, 'topLevel': False
+		},
+		ids[3]: {
+			'opcode': 'data_setvariableto', 'next': ids[4], 'parent': ids[0],
+			'inputs': {'VALUE': [3, [12, f'{prefix}var0', f'{prefix}var0id'], [10, '0']]},
+			'fields': {'VARIABLE': [f'{prefix}var0', f'{prefix}var0id']},
+			'shadow': False, 'topLevel': False
+		}
+	}
+	if callee is None:
+		script[ids[4]] = {
+			'opcode': 'looks_nextcostume', 'next': None, 'parent': ids[3],
+			'inputs': {}, 'fields': {}, 'shadow': False, 'topLevel': False
+		}
+	else:
+		callee_index = callee.split('proc')[-1].split(' ')[0]
+		script[ids[4]] = {
+			'opcode': 'procedures_call', 'next': None, 'parent': ids[3],
+			'inputs': {f'{prefix}arg{callee_index}': [1, [10, 'hi']]}, 'fields': {},
+			'shadow': False, 'topLevel': False,
+			'mutation': {
+				'tagName': 'mutation', 'children': [], 'proccode': callee,
+				'argumentids': f'["{prefix}arg{callee_index}"]', 'warp': 'false'
+			}
+		}
+	for i in range(5, len(ids)):
+		script[ids[i - 1]]['next'] = ids[i]
+		script[ids[i]] = {
+			'opcode': 'motion_movesteps', 'next': None, 'parent': ids[i - 1],
+			'inputs': {'STEPS': [1, [4, '10']]}, 'fields': {},
+			'shadow': False, 'topLevel': False
+		}
+	return script
+
+
+def make_blocks(count: int, procedures: int = None, prefix: str = 'b') -> dict[str, dict]:
+	"""About `count` blocks split over `procedures` procedures, each calling
+	the one before it, plus a green flag script calling the last one."""
+	if procedures is None:
+		procedures = max(count // 8, 1)
+	per_procedure = max(count // procedures, 5)
+	blocks = {}
+	callee = None
+	for index in range(procedures):
+		blocks.update(make_procedure(prefix, index, per_procedure, callee))
+		callee = f'{prefix}proc{index} %s'
+	blocks[f'{prefix}flag'] = {
+		'opcode': 'event_whenflagclicked', 'next': f'{prefix}call', 'parent': None,
+		'inputs': {}, 'fields': {}, 'shadow': False, 'topLevel': True, 'x': -200, 'y': 0
+	}
+	blocks[f'{prefix}call'] = {
+		'opcode': 'procedures_call', 'next': None, 'parent': f'{prefix}flag',
+		'inputs': {f'{prefix}arg{procedures - 1}': [1, [10, 'go']]}, 'fields': {},
+		'shadow': False, 'topLevel': False,
+		'mutation': {
+			'tagName': 'mutation', 'children': [], 'proccode': callee,
+			'argumentids': f'["{prefix}arg{procedures - 1}"]', 'warp': 'false'
+		}
+	}
+	return blocks
+
+
+def make_asset(text: str, size: int = 0) -> tuple[dict, bytes]:
+	"""An svg of at least `size` bytes, padded with incompressible data like
+	a real bitmap would be."""
+	padding = random.Random(text).randbytes(size // 2).hex()
+	data = f'<svg xmlns="http://www.w3.org/2000/svg"><!-- {text} {padding} --></svg>'.encode()
+	md5 = hashlib.md5(data).hexdigest()
+	return {
+		'assetId': md5, 'name': text, 'md5ext': f'{md5}.svg', 'dataFormat': 'svg',
+		'rotationCenterX': 0, 'rotationCenterY': 0
+	}, data
+
+
+def make_target(name: str, blocks: dict[str, dict], variables: int, lists: int,
+                costumes: list[dict], is_stage: bool = False) -> dict:
+	prefix = f'{name}_'
+	return {
+		'isStage': is_stage, 'name': name,
+		'variables': {
+			f'{prefix}var{i}id': [f'{prefix}var{i}', 0]
+			for i in range(variables)
+		},
+		'lists': {
+			f'{prefix}list{i}id': [f'{prefix}list{i}', []]
+			for i in range(lists)
+		},
+		'broadcasts': {}, 'blocks': blocks, 'comments': {},
+		'currentCostume': 0, 'costumes': costumes, 'sounds': [],
+		'volume': 100, 'layerOrder': 0
+	}
+
+
+def make_project(path: str, sprites: int = 1, blocks: int = 1000,
+                 procedures: int = None, variables: int = 10, lists: int = 2,
+                 costumes: int = 4, costume_size: int = 0) -> str:
+	"""Writes a project with a Stage and `sprites` sprites, each with the
+	given number of blocks, procedures, variables, lists and costumes."""
+	name = os.path.basename(path).replace('.sb3', '')
+	assets = {}
+	backdrop, assets['backdrop'] = make_asset('backdrop')
+	targets = [make_target('Stage', {}, 0, 0, [backdrop], True)]
+	for i in range(sprites):
+		sprite_name = name if i == 0 else f'{name}{i}'
+		sprite_costumes = []
+		for c in range(costumes):
+			costume, assets[f'{sprite_name}-{c}'] = make_asset(f'{sprite_name}-{c}', costume_size)
+			sprite_costumes.append(costume)
+		targets.append(make_target(
+			sprite_name, make_blocks(blocks, procedures, f'{sprite_name}_'),
+			max(variables, 1), lists, sprite_costumes
+		))
+	project = {
+		'targets': targets, 'monitors': [], 'extensions': [],
+		'meta': {'semver': '3.0.0', 'vm': '0.2.0', 'agent': 'spm synth'}
+	}
+	with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+		zf.writestr('project.json', json.dumps(project, ensure_ascii=False))
+		for text, data in assets.items():
+			zf.writestr(f'{hashlib.md5(data).hexdigest()}.svg', data)
+	return path
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Write a synthetic .sb3')
+	parser.add_argument('path')
+	parser.add_argument('--sprites', type=int, default=1)
+	parser.add_argument('--blocks', type=int, default=1000)
+	parser.add_argument('--procedures', type=int, default=None)
+	parser.add_argument('--variables', type=int, default=10)
+	parser.add_argument('--lists', type=int, default=2)
+	parser.add_argument('--costumes', type=int, default=4)
+	parser.add_argument('--costume-size', type=int, default=0)
+	args = parser.parse_args()
+	make_project(
+		args.path, args.sprites, args.blocks, args.procedures,
+		args.variables, args.lists, args.costumes, args.costume_size
+	)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,31 @@
+import os
+import re
+import sys
+
+# Style tags such as [green] or [/bold red]
+MARKUP = re.compile(r'\[/?[a-z]+(?: [a-z]+)*\]')
+
+plain = os.environ.get('SPM_PLAIN', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def is_plain(file=None) -> bool:
+	"""Plain when asked for or when the output is not a terminal, in which
+	case rich would not colour anything anyway."""
+	file = file or sys.stdout
+	return plain or not file.isatty()
+
+
+def wants_rich_help(argv: list[str]) -> bool:
+	"""Whether `argv` ends up printing help, which rich-click renders."""
+	if is_plain() or '--plain' in argv:
+		return False
+	return not argv or '--help' in argv
+
+
+def echo(markup: str, file=None):
+	"""Prints rich markup. rich is only imported when it would be used."""
+	if is_plain(file):
+		print(MARKUP.sub('', markup), file=file)
+		return
+	from rich import print as rprint
+	rprint(markup, file=file)
@@ -0,0 +1,135 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cache import ProjectCache
+from commands import Session
+from loader import load_package
+from lock import Lock, get_lock_path
+from metrics import call_measured, metrics
+from package import Package
+from resolver import satisfies
+from scratch import Project, Sprite
+
+# The package being rolled out, set once in each worker by `init_worker`
+package: Package = None
+
+
+def init_worker(pkg_sprite: Package):
+	global package
+	package = pkg_sprite
+
+
+def find_projects(directory: str, exclude: str = None) -> list[str]:
+	"""Every .sb3 under `directory` but `exclude`. spm-modules and hidden
+	directories are left out, they hold dependencies, not projects."""
+	exclude = os.path.abspath(exclude) if exclude is not None else None
+	paths = []
+	for root, dirs, files in os.walk(directory):
+		dirs[:] = sorted(x for x in dirs if x != 'spm-modules' and not x.startswith('.'))
+		for name in sorted(files):
+			path = os.path.join(root, name)
+			if name.endswith('.sb3') and os.path.abspath(path) != exclude:
+				paths.append(path)
+	return paths
+
+
+def update_project(main_path: str, pkg_path: str, main_sprite_name: str = None,
+                   use_cache: bool = True) -> dict:
+	"""Merges `package` into main again unless main already has it as it
+	is. Only that package changes, main's other dependencies are left as
+	they are. The check only parses project.json, the sprite is tracked
+	only when its package_json can't tell, as when it's a legacy one."""
+	start = time.perf_counter()
+	project = Project(main_path)
+	try:
+		sprite = project.sprites[main_sprite_name or project.get_main_sprite_name()]
+		package_json = sprite.blocks.get('package_json')
+		packages = None
+		if package_json is not None:
+			packages = json.loads(package_json['parent']).get('packages')
+		if package_json is None or packages is not None and package.name not in packages:
+			status = 'not using'
+		elif packages is not None and not packages[package.name].get('shaken') and all(
+			packages[package.name].get(key) == value
+			for key, value in package.get_package_info().items()
+		):
+			status = 'up to date'
+		else:
+			status = merge_package(sprite, main_path, pkg_path, use_cache)
+	finally:
+		project.close()
+	return {'status': status, 'seconds': time.perf_counter() - start}
+
+
+def merge_package(sprite: Sprite, main_path: str, pkg_path: str, use_cache: bool = True) -> str:
+	Package.convert_sprite(sprite)
+	packages = sprite.package_json['packages']
+	if package.name not in packages:
+		return 'not using'
+	if sprite.is_up_to_date(package):
+		return 'up to date'
+	for name, spec in package.package_json['dependencies'].items():
+		if name not in packages or not satisfies(packages[name]['version'], spec):
+			raise ValueError(
+				f'{package.name} {package.package_json["version"]} needs {name} {spec}, '
+				f'merge it into {main_path} first'
+			)
+	with metrics.phase('merge'):
+		sprite.add(package)
+	Session().export(sprite, main_path)
+	lock = Lock(get_lock_path(main_path), use_cache)
+	if os.path.exists(lock.path):
+		lock.set_packages({package.name: (pkg_path, package)}, set(packages))
+		lock.set_main(main_path, sprite.name)
+		lock.save()
+	return 'updated'
+
+
+def update_all(directory: str, pkg_path: str, main_sprite_name: str = None,
+               pkg_sprite_name: str = None, jobs: int = 0, use_cache: bool = True,
+               log=print) -> dict[str, dict]:
+	"""Updates the package in `pkg_path` in every project under `directory`
+	that has it, on `jobs` processes, 0 for one per core. The package is
+	loaded and tracked once, workers get it when they start. Returns path
+	-> {'status', 'seconds', 'error'}, status being 'updated', 'up to date',
+	'not using' or 'failed'."""
+	global package
+	start = time.perf_counter()
+	paths = find_projects(directory, pkg_path)
+	pkg_sprite = load_package(pkg_path, pkg_sprite_name, use_cache=use_cache)
+	pkg_sprite.get_digest()
+	# Forked workers would share the open zip, and its file offset
+	pkg_sprite.project.archive.close()
+	jobs = min(jobs or os.cpu_count() or 1, len(paths))
+	results = {}
+	def finish(path: str, get_result):
+		try:
+			result = get_result()
+		except Exception as e:
+			result = {'status': 'failed', 'seconds': None, 'error': f'{type(e).__name__}: {e}'}
+			log(f'{path}: failed, {result["error"]}')
+		else:
+			log(f'{path}: {result["status"]} in {result["seconds"]:.3f}s')
+		results[path] = result
+	if jobs <= 1:
+		package = pkg_sprite
+		for path in paths:
+			finish(path, lambda: update_project(path, pkg_path, main_sprite_name, use_cache))
+	else:
+		with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(pkg_sprite,)) as pool:
+			state = metrics.get_worker_state()
+			futures = {
+				pool.submit(
+					call_measured, state,
+					update_project, path, pkg_path, main_sprite_name, use_cache
+				): path
+				for path in paths
+			}
+			for future in as_completed(futures):
+				finish(futures[future], lambda: metrics.collect(future.result()))
+	if use_cache:
+		ProjectCache().evict()
+	log(f'{len(paths)} projects in {time.perf_counter() - start:.3f}s')
+	return {path: results[path] for path in paths}
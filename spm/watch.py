@@ -0,0 +1,124 @@
+import os
+import time
+import zipfile
+
+from package import Package
+from scratch import Project
+
+
+def get_stat(path: str) -> tuple[int, int]:
+	try:
+		stat = os.stat(path)
+	except FileNotFoundError:
+		return None
+	return stat.st_mtime_ns, stat.st_size
+
+
+class Watcher:
+	"""Keeps a main project and its packages in memory and merges a package
+	again whenever its file changes. Files are polled every `interval`
+	seconds, a change is only acted on once the file has stayed the same
+	for `debounce` seconds, so half written files are left alone."""
+	def __init__(self, main_path: str, pkg_paths: list[str],
+	             main_sprite_name: str = None, pkg_sprite_name: str = None,
+	             interval: float = 0.1, debounce: float = 0.2, log=print):
+		self.main_path = main_path
+		self.pkg_paths = list(pkg_paths)
+		self.main_sprite_name = main_sprite_name
+		self.pkg_sprite_name = pkg_sprite_name
+		self.interval = interval
+		self.debounce = debounce
+		self.log = log
+		self.stats: dict[str, tuple[int, int]] = {}
+		# path -> (stat, when it was last seen changing)
+		self.pending: dict[str, tuple[tuple[int, int], float]] = {}
+		self.main: Project = None
+		self.sprite: Package = None
+		self.packages: dict[str, Package] = {}
+
+	def load_main(self):
+		stat = get_stat(self.main_path)
+		main = Project(self.main_path)
+		if self.main_sprite_name is None:
+			self.main_sprite_name = main.get_main_sprite_name()
+		sprite = main.sprites[self.main_sprite_name]
+		Package.convert_sprite(sprite)
+		self.main, self.sprite = main, sprite
+		self.stats[self.main_path] = stat
+
+	def load_package(self, pkg_path: str):
+		stat = get_stat(pkg_path)
+		self.packages[pkg_path] = Package.load(pkg_path, self.pkg_sprite_name)
+		self.stats[pkg_path] = stat
+
+	def export(self):
+		self.main.export_sb3(self.main_path)
+		self.main.close()
+		# Our own write is not a change to react to
+		self.stats[self.main_path] = get_stat(self.main_path)
+
+	def start(self):
+		self.load_main()
+		for pkg_path in self.pkg_paths:
+			self.load_package(pkg_path)
+		self.merge(self.pkg_paths)
+
+	def merge(self, pkg_paths: list[str]) -> bool:
+		changed = False
+		for pkg_path in pkg_paths:
+			pkg_sprite = self.packages[pkg_path]
+			if not self.sprite.is_up_to_date(pkg_sprite):
+				self.sprite.add(pkg_sprite)
+				changed = True
+		if changed:
+			self.export()
+		return changed
+
+	def get_settled(self) -> list[str]:
+		"""Paths whose changes have settled for `debounce` seconds."""
+		now = time.monotonic()
+		settled = []
+		for path in [self.main_path, *self.pkg_paths]:
+			stat = get_stat(path)
+			if stat is None or stat == self.stats.get(path):
+				self.pending.pop(path, None)
+				continue
+			if path not in self.pending or self.pending[path][0] != stat:
+				self.pending[path] = (stat, now)
+			elif now - self.pending[path][1] >= self.debounce:
+				self.pending.pop(path)
+				settled.append(path)
+		return settled
+
+	def poll(self) -> bool:
+		"""One round of checking files, returns whether main was written."""
+		settled = self.get_settled()
+		if not settled:
+			return False
+		start = time.perf_counter()
+		try:
+			if self.main_path in settled:
+				# Saved from the editor, every package goes on top again
+				self.load_main()
+				self.log(f'Reloaded {self.main_path}')
+				settled = self.pkg_paths
+			else:
+				for pkg_path in settled:
+					self.load_package(pkg_path)
+			changed = self.merge(settled)
+		except (zipfile.BadZipFile, KeyError, ValueError) as e:
+			# Most likely caught mid-write, the next change retries
+			self.log(f'Skipped {", ".join(settled)}: {type(e).__name__}: {e}')
+			return False
+		if changed:
+			self.log(
+				f'Merged {", ".join(settled)} into {self.main_path} '
+				f'in {time.perf_counter() - start:.3f}s'
+			)
+		return changed
+
+	def run(self):
+		self.start()
+		while True:
+			time.sleep(self.interval)
+			self.poll()
@@ -0,0 +1,48 @@
+import json
+import os
+import shutil
+import sys
+import zipfile
+
+import pytest
+
+# spm runs as `python spm`, its modules import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'spm'))
+
+from synth import make_project
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+	"""Keeps the project cache and asset store out of the user's."""
+	monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+	monkeypatch.setenv('SPM_PLAIN', '1')
+
+
+@pytest.fixture
+def make_sb3(tmp_path):
+	"""Writes a small synthetic project named `name` into the test's
+	directory, its first sprite is `name` too."""
+	def make(name: str, **kwargs) -> str:
+		kwargs = {'blocks': 40, 'procedures': 4, 'variables': 2, 'lists': 1, 'costumes': 2, **kwargs}
+		return make_project(str(tmp_path / f'{name}.sb3'), **kwargs)
+	return make
+
+
+def edit_sprite(path: str, edit, out_path: str = None):
+	"""Calls `edit(target)` on the first sprite of `path` and writes the
+	project back, to `out_path` if given."""
+	with zipfile.ZipFile(path) as zf:
+		files = {name: zf.read(name) for name in zf.namelist()}
+	project = json.loads(files['project.json'])
+	edit(next(x for x in project['targets'] if not x['isStage']), files)
+	files['project.json'] = json.dumps(project).encode()
+	with zipfile.ZipFile(out_path or path, 'w') as zf:
+		for name, data in files.items():
+			zf.writestr(name, data)
+
+
+def copy(path: str, name: str) -> str:
+	new_path = os.path.join(os.path.dirname(path), name)
+	shutil.copyfile(path, new_path)
+	return new_path
@@ -0,0 +1,45 @@
+import hashlib
+import os
+import zipfile
+
+import commands
+from conftest import edit_sprite
+from daemon import DaemonSession
+
+
+def replace_costume(target: dict, files: dict):
+	"""The first costume swapped for another, its asset gone from the file."""
+	costume = target['costumes'].pop(0)
+	files.pop(costume['md5ext'])
+	data = f'<svg>{costume["name"]} v2</svg>'.encode()
+	md5 = hashlib.md5(data).hexdigest()
+	target['costumes'].insert(0, {**costume, 'assetId': md5, 'md5ext': f'{md5}.svg'})
+	files[f'{md5}.svg'] = data
+
+
+def test_cached_main_survives_replaced_package(make_sb3):
+	main_path, a_path, b_path = make_sb3('Main'), make_sb3('A'), make_sb3('B')
+	session = DaemonSession()
+	commands.merge(session, main_path, [a_path], use_cache=False)
+	with zipfile.ZipFile(main_path) as zf:
+		merged_a = set(zf.namelist())
+	edit_sprite(a_path, replace_costume)
+	commands.merge(session, main_path, [b_path], use_cache=False)
+	assert [x[0] for x in session.projects].count('main') == 1
+	with zipfile.ZipFile(main_path) as zf:
+		assert merged_a < set(zf.namelist())
+		zf.testzip()
+	assert list(commands.list_packages(session, main_path)) == ['A', 'B']
+
+
+def test_main_exported_elsewhere_is_dropped(make_sb3, tmp_path):
+	main_path = make_sb3('Main')
+	out_path = str(tmp_path / 'out' / 'Main.sb3')
+	os.mkdir(tmp_path / 'out')
+	session = DaemonSession()
+	commands.export(session, main_path, out_path)
+	assert not session.projects
+	os.remove(out_path)
+	commands.merge(session, main_path, [make_sb3('Lib')], use_cache=False)
+	with zipfile.ZipFile(main_path) as zf:
+		zf.testzip()
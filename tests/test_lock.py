@@ -0,0 +1,53 @@
+import pytest
+
+import commands
+from cache import hash_file
+from commands import Session
+from conftest import edit_sprite
+from loader import load_package
+from lock import Lock, get_lock_path
+
+
+def test_lock_round_trip(make_sb3):
+	main_path, lib_path = make_sb3('Main'), make_sb3('Lib')
+	commands.merge(Session(), main_path, [lib_path], use_cache=False)
+	lock = Lock(get_lock_path(main_path), use_cache=False)
+	assert lock.path == main_path + '.lock'
+	assert lock.load() == {
+		'lockVersion': 1,
+		'main': {'path': 'Main.sb3', 'sprite': 'Main', 'hash': hash_file(main_path)},
+		'packages': {
+			'Lib': {
+				'path': 'Lib.sb3', 'version': '0.0.0', 'hash': hash_file(lib_path),
+				'digest': load_package(lib_path, use_cache=False).get_digest()
+			}
+		}
+	}
+	assert lock.verify(main_path, [lib_path]) == []
+	assert commands.merge(Session(), main_path, [lib_path], use_cache=False, frozen=True) == ({}, {})
+
+	# Nothing changed, neither does the lock
+	with open(lock.path) as fp:
+		data = fp.read()
+	assert commands.merge(Session(), main_path, [lib_path], use_cache=False) == ({}, {})
+	with open(lock.path) as fp:
+		assert fp.read() == data
+
+	edit_sprite(lib_path, lambda target, files: target['variables'].update({'newid': ['new', 0]}))
+	assert Lock(lock.path, use_cache=False).verify(main_path, [lib_path]) == [f'Lib: {lib_path} changed']
+	with pytest.raises(ValueError, match='is out of date'):
+		commands.merge(Session(), main_path, [lib_path], use_cache=False, frozen=True)
+	commands.merge(Session(), main_path, [lib_path], use_cache=False)
+	assert Lock(lock.path, use_cache=False).verify(main_path, [lib_path]) == []
+
+
+def test_lock_verify(make_sb3):
+	main_path, lib_path, other_path = make_sb3('Main'), make_sb3('Lib'), make_sb3('Other')
+	lock = Lock(get_lock_path(main_path), use_cache=False)
+	assert lock.verify(main_path, [lib_path]) == [f'{lock.path} does not exist']
+	commands.merge(Session(), main_path, [lib_path], use_cache=False)
+	assert lock.verify(main_path, [lib_path, other_path]) == [f'{other_path} is not in {lock.path}']
+	assert lock.verify(main_path, [], 'Stage') == [f'{lock.path} was written for sprite Main']
+	assert lock.verify(other_path, []) == [f'{lock.path} is not the lock of {other_path}']
+	edit_sprite(main_path, lambda target, files: None)
+	assert lock.verify(main_path, []) == [f'{main_path} changed']
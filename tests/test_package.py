@@ -0,0 +1,113 @@
+import hashlib
+import json
+import zipfile
+
+import commands
+from commands import Session
+from conftest import copy, edit_sprite
+from graph import BlockGraph
+from loader import load_package
+
+GRAPH_INDEXES = ('parents', 'children', 'tops', 'definitions', 'callers', 'proccodes')
+
+
+def edit_lib(target: dict, files: dict):
+	"""A new version of Lib: an input changed, a procedure gone, a variable
+	added and a costume replaced."""
+	target['blocks']['Lib_call']['inputs']['Lib_arg3'] = [1, [10, 'changed']]
+	for id in [x for x in target['blocks'] if x.startswith('Lib_0_')]:
+		target['blocks'].pop(id)
+	target['variables']['Lib_newid'] = ['Lib_new', 5]
+	target['costumes'].pop(0)
+	data = b'<svg>new</svg>'
+	md5 = hashlib.md5(data).hexdigest()
+	target['costumes'].append({
+		'assetId': md5, 'name': 'Lib-new', 'md5ext': f'{md5}.svg', 'dataFormat': 'svg',
+		'rotationCenterX': 0, 'rotationCenterY': 0
+	})
+	files[f'{md5}.svg'] = data
+
+
+def drop_flag(target: dict, files: dict):
+	"""Nothing in Lib calls its procedures any more."""
+	target['blocks'].pop('Lib_flag')
+	target['blocks'].pop('Lib_call')
+
+
+def read_main(path: str) -> dict:
+	"""Main's sprite as it is, with what only depends on order sorted."""
+	with zipfile.ZipFile(path) as zf:
+		project = json.loads(zf.read('project.json'))
+		names = sorted(zf.namelist())
+	target = next(x for x in project['targets'] if x['name'] == 'Main')
+	package_json = json.loads(target['blocks'].pop('package_json')['parent'])
+	for owned in package_json['packages'].values():
+		for key in ('blocks', 'variables', 'lists', 'costumes'):
+			owned[key] = sorted(owned[key])
+	return {
+		'blocks': target['blocks'],
+		'variables': target['variables'],
+		'lists': target['lists'],
+		'costumes': sorted(target['costumes'], key=lambda x: x['name']),
+		'currentCostume': target['costumes'][target['currentCostume']]['name'],
+		'package_json': package_json,
+		'files': names
+	}
+
+
+def assert_graph_is_current(sprite):
+	graph, fresh = sprite.get_graph(), BlockGraph(dict(sprite.blocks))
+	for key in GRAPH_INDEXES:
+		assert getattr(graph, key) == getattr(fresh, key), key
+
+
+def test_delta_update_matches_fresh_merge(make_sb3):
+	main_path, lib_path = make_sb3('Main'), make_sb3('Lib')
+	fresh_path = copy(main_path, 'Fresh.sb3')
+	commands.merge(Session(), main_path, [lib_path], use_cache=False)
+	edit_sprite(lib_path, edit_lib)
+	merged, _ = commands.merge(Session(), main_path, [lib_path], use_cache=False)
+	delta = merged['Lib']
+	assert delta['blocks']['changed'] and delta['blocks']['removed']
+	assert delta['variables']['added'] == ['Lib_new']
+	assert delta['costumes'] == {'added': ['Lib-new'], 'changed': [], 'removed': ['Lib-0']}
+	commands.merge(Session(), fresh_path, [lib_path], use_cache=False)
+	assert read_main(main_path) == read_main(fresh_path)
+
+
+def test_graph_stays_current(make_sb3, tmp_path):
+	main_path, lib_path = make_sb3('Main'), make_sb3('Lib')
+	v2_path = str(tmp_path / 'v2' / 'Lib.sb3')
+	(tmp_path / 'v2').mkdir()
+	edit_sprite(lib_path, edit_lib, v2_path)
+	edit_sprite(v2_path, drop_flag)
+	sprite = Session().open_main(main_path)
+	blocks = dict(sprite.blocks)
+	assert_graph_is_current(sprite)
+	sprite.add(load_package(lib_path, use_cache=False))
+	assert_graph_is_current(sprite)
+	v2 = load_package(v2_path, use_cache=False)
+	sprite.add(v2)
+	assert_graph_is_current(sprite)
+	removed = sprite.tree_shake()
+	assert removed['Lib']['procedures'] == ['Lib_proc1 %s', 'Lib_proc2 %s', 'Lib_proc3 %s']
+	assert_graph_is_current(sprite)
+	assert sprite.is_up_to_date(v2)
+	sprite.remove('Lib')
+	assert_graph_is_current(sprite)
+	assert sprite.blocks.keys() == blocks.keys()
+	sprite.project.close()
+
+
+def test_remove_keeps_current_costume(make_sb3):
+	main_path = make_sb3('Main')
+	sprite = Session().open_main(main_path)
+	for name, costumes in (('Lib', 2), ('Util', 1)):
+		sprite.add(load_package(make_sb3(name, costumes=costumes), use_cache=False))
+	assert list(sprite.costumes) == ['Main-0', 'Main-1', 'Lib-0', 'Lib-1', 'Util-0']
+	sprite.json['currentCostume'] = 4
+	sprite.remove('Lib')
+	assert list(sprite.costumes)[sprite.json['currentCostume']] == 'Util-0'
+	sprite.remove('Util')
+	assert sprite.json['currentCostume'] == 0
+	sprite.project.close()
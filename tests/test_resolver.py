@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+import commands
+from commands import Session
+from resolver import Resolver, parse_spec, parse_version, satisfies, sort_graph
+from synth import make_project
+
+
+def test_parse_version():
+	assert parse_version('1.2.0') == (1, 2)
+	assert parse_version('1.2') == parse_version('1.2.0.0')
+	assert parse_version('0') == (0,)
+	for version in ('', '1.', 'v1', '1.2-beta', '^1.0.0'):
+		with pytest.raises(ValueError):
+			parse_version(version)
+
+
+def test_parse_spec():
+	assert parse_spec('>=1.2, <2') == [('>=', (1, 2)), ('<', (2,))]
+	assert parse_spec('1.4') == [('==', (1, 4))]
+	assert parse_spec('*') == parse_spec('') == []
+	with pytest.raises(ValueError):
+		parse_spec('~1.0')
+
+
+@pytest.mark.parametrize('version, spec, expected', [
+	('1.5.0', '>=1.2, <2', True),
+	('2.0.0', '>=1.2, <2', False),
+	('1.1.9', '>=1.2, <2', False),
+	('1.2', '1.2.0', True),
+	('1.2.1', '1.2', False),
+	('3.0.0', '!=2', True),
+	('0.0.1', '*', True),
+	('1.10.0', '>1.9', True),
+])
+def test_satisfies(version, spec, expected):
+	assert satisfies(version, spec) is expected
+
+
+def test_check_version_lists_every_unmet_spec():
+	resolver = Resolver(None)
+	resolver.required = {'Dep': [('Main', '>=2'), ('Lib', '<3'), ('Other', '!=1.0')]}
+	resolver.check_version('Dep', '2.5')
+	with pytest.raises(ValueError, match=r'is version 3\.0 but Lib needs <3$'):
+		resolver.check_version('Dep', '3.0')
+	with pytest.raises(ValueError, match='Main needs >=2, Other needs !=1.0'):
+		resolver.check_version('Dep', '1.0')
+
+
+def test_sort_graph_orders_dependencies_first():
+	edges = {'a': ['b', 'c'], 'b': ['c'], 'c': [], 'd': ['a']}
+	assert sort_graph(['a', 'd'], edges.get) == ['c', 'b', 'a', 'd']
+	assert sort_graph(['d'], edges.get) == ['c', 'b', 'a', 'd']
+
+
+def test_sort_graph_cycle():
+	edges = {'a': ['b'], 'b': ['c'], 'c': ['a'], 'd': ['d']}
+	with pytest.raises(ValueError, match='Dependency cycle: a -> b -> c -> a'):
+		sort_graph(['a'], edges.get)
+	with pytest.raises(ValueError, match='Target cycle: d -> d'):
+		sort_graph(['d'], edges.get, 'Target')
+
+
+@pytest.fixture
+def project(make_sb3, tmp_path):
+	"""Main, Lib next to it and Dep in spm-modules, Lib needs Dep."""
+	os.mkdir(tmp_path / 'spm-modules')
+	dep_path = make_project(str(tmp_path / 'spm-modules' / 'Dep.sb3'), blocks=20, costumes=1)
+	main_path, lib_path = make_sb3('Main'), make_sb3('Lib')
+	commands.set_dependency(Session(), lib_path, 'Dep', '>=1.0, <2')
+	return main_path, lib_path, dep_path
+
+
+def test_merge_resolves_dependencies(project):
+	main_path, lib_path, dep_path = project
+	commands.set_version(Session(), dep_path, '1.3.0')
+	merged, _ = commands.merge(Session(), main_path, [lib_path], use_cache=False)
+	assert list(merged) == ['Dep', 'Lib']
+
+
+def test_merge_version_conflict(project):
+	main_path, lib_path, dep_path = project
+	commands.set_version(Session(), dep_path, '2.0.0')
+	with pytest.raises(ValueError, match='"Dep" is version 2.0.0 but Lib needs >=1.0, <2'):
+		commands.merge(Session(), main_path, [lib_path], use_cache=False)
+
+
+def test_merge_dependency_cycle(project):
+	main_path, lib_path, dep_path = project
+	commands.set_version(Session(), dep_path, '1.0.0')
+	commands.set_dependency(Session(), dep_path, 'Lib')
+	with pytest.raises(ValueError, match='Dependency cycle: (Lib -> Dep -> Lib|Dep -> Lib -> Dep)'):
+		commands.merge(Session(), main_path, [lib_path], use_cache=False)
@@ -0,0 +1,24 @@
+import json
+import zipfile
+
+import commands
+from commands import Session
+from conftest import edit_sprite
+
+
+def drop_asset(target: dict, files: dict):
+	files.pop(target['costumes'][1]['md5ext'])
+
+
+def test_missing_assets_are_left_out(make_sb3):
+	main_path, lib_path = make_sb3('Main'), make_sb3('Lib')
+	edit_sprite(main_path, drop_asset)
+	edit_sprite(lib_path, drop_asset)
+	commands.set_version(Session(), main_path, '1.0.0')
+	commands.merge(Session(), main_path, [lib_path], use_cache=False)
+	with zipfile.ZipFile(main_path) as zf:
+		project = json.loads(zf.read('project.json'))
+		names = set(zf.namelist())
+	target = next(x for x in project['targets'] if x['name'] == 'Main')
+	assert [x['name'] for x in target['costumes']] == ['Main-0', 'Main-1', 'Lib-0', 'Lib-1']
+	assert [x['md5ext'] in names for x in target['costumes']] == [True, False, True, False]
@@ -124,10 +124,10 @@ class Project:
 				 and block['inputs']['custom_block'][1].count(OMEGA) == 0 ):
 				block['inputs']['custom_block'][1] = self.id+block['inputs']['custom_block'][1]
 			elif block['opcode'] in ('procedures_prototype', 'procedures_call'):
-				block['mutation']['argumentids'] = str([
+				block['mutation']['argumentids'] = json.dumps([
 					self.id+x if x.count(OMEGA) == 0 else x
-					for x in eval(block['mutation']['argumentids'])
-				]).replace("'", '"') # FIXME?
+					for x in json.loads(block['mutation']['argumentids'])
+				], ensure_ascii=False)
 				block['inputs'] = {
 					(self.id+key) if key.count(OMEGA) == 0 else key: value
 					for key, value in block['inputs'].items()
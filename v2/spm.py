@@ -23,22 +23,31 @@ import json
 import os
 import sys
 import tempfile
+import zipfile
 
-from rich import print as rprint
 from collections import defaultdict
 
 # CONFIG_FLAGS
 HIDE_BLOCKS = False
 
 
+def rprint(*args, **kwargs):
+	# rich is slow to import and most runs print nothing
+	from rich import print
+	print(*args, **kwargs)
+
+
 class Zip:
 	@staticmethod
 	def unzip(in_path: str, out_path: str):
-		os.system(f"unzip -o '{in_path}' -d '{out_path}' > /dev/null")
+		with zipfile.ZipFile(in_path) as zf:
+			zf.extractall(out_path)
 	
 	@staticmethod
 	def zip(in_path: str, out_path: str):
-		os.system(f"zip -rj '{out_path}' '{in_path}' > /dev/null")
+		with zipfile.ZipFile(out_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+			for name in os.listdir(in_path):
+				zf.write(os.path.join(in_path, name), name)
 
 
 class Package:
@@ -158,10 +167,10 @@ class Sprite:
 				 and block['inputs']['custom_block'][1].count(OMEGA) == 0 ):
 				block['inputs']['custom_block'][1] = tag+block['inputs']['custom_block'][1]
 			elif block['opcode'] in ('procedures_prototype', 'procedures_call'):
-				block['mutation']['argumentids'] = str([
+				block['mutation']['argumentids'] = json.dumps([
 					tag+x if x.count(OMEGA) == 0 else x
-					for x in eval(block['mutation']['argumentids'])
-				]).replace("'", '"') # FIXME?
+					for x in json.loads(block['mutation']['argumentids'])
+				], ensure_ascii=False)
 				block['inputs'] = {
 					(tag+key) if key.count(OMEGA) == 0 else key: value
 					for key, value in block['inputs'].items()